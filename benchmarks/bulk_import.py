@@ -0,0 +1,98 @@
+"""Import throughput benchmark for ``POST /livro/bulk``.
+
+Creates the same number of books one ``POST /livro`` at a time and through a
+single streamed NDJSON upload, and prints the rows per second of each, against
+a running server:
+
+    python -m benchmarks.bulk_import http://localhost:8000 1000 100000
+
+The single-row pass only runs for the first size, the rest would take too
+long. Every run registers a new user and author, so the titles never collide
+with earlier runs.
+"""
+
+import json
+import sys
+import uuid
+from time import perf_counter
+
+import httpx
+
+
+def login(client: httpx.Client) -> dict:
+    name = f'bench-{uuid.uuid4().hex[:8]}'
+    client.post(
+        '/conta/',
+        json={'username': name, 'email': f'{name}@bench.com', 'senha': name},
+    ).raise_for_status()
+    response = client.post(
+        '/auth/token', data={'username': f'{name}@bench.com', 'password': name}
+    )
+    response.raise_for_status()
+
+    return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+def rows(prefix: str, author_id: int, size: int):
+    for number in range(size):
+        yield {
+            'ano': 1900 + number % 120,
+            'titulo': f'{prefix} {number}',
+            'romancista_id': author_id,
+        }
+
+
+def single(client, headers, prefix, author_id, size) -> float:
+    start = perf_counter()
+
+    for row in rows(prefix, author_id, size):
+        client.post('/livro/', json=row, headers=headers).raise_for_status()
+
+    return size / (perf_counter() - start)
+
+
+def bulk(client, headers, prefix, author_id, size) -> float:
+    body = (
+        f'{json.dumps(row)}\n'.encode()
+        for row in rows(prefix, author_id, size)
+    )
+
+    start = perf_counter()
+    response = client.post(
+        '/livro/bulk',
+        content=body,
+        headers={**headers, 'Content-Type': 'application/x-ndjson'},
+    )
+    response.raise_for_status()
+    elapsed = perf_counter() - start
+
+    assert response.json() == {'created': size, 'errors': []}
+
+    return size / elapsed
+
+
+def main(url: str, sizes: list[int]):
+    with httpx.Client(base_url=url, timeout=None) as client:
+        headers = login(client)
+        run = uuid.uuid4().hex[:8]
+        author = client.post(
+            '/romancista/', json={'nome': f'bench {run}'}, headers=headers
+        )
+        author.raise_for_status()
+        author_id = author.json()['id']
+
+        print(f'{"rows":>10} {"single (rows/s)":>16} {"bulk (rows/s)":>14}')
+
+        for index, size in enumerate(sizes):
+            prefix = f'{run} {size}'
+            one_by_one = f'{"-":>16}'
+            if index == 0:
+                rate = single(client, headers, f'{prefix} s', author_id, size)
+                one_by_one = f'{rate:>16.0f}'
+            streamed = bulk(client, headers, f'{prefix} b', author_id, size)
+
+            print(f'{size:>10} {one_by_one} {streamed:>14.0f}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], [int(size) for size in sys.argv[2:]])
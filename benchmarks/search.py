@@ -0,0 +1,137 @@
+"""Search latency benchmark for ``GET /livro/``.
+
+Grows the books table through the given sizes and times the substring
+(``ILIKE``) and similarity (``fuzzy=true``) queries at each step. The same
+``MATCHES`` rows match the searched words at every size, so the timings show
+how the queries scale with the table rather than with the result:
+
+    python -m benchmarks.search postgresql+psycopg://... 10000 100000 1000000
+
+The tables are dropped and recreated from the models, so never point it at a
+database holding real data.
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+from time import perf_counter
+
+from sqlalchemy import REAL, String, bindparam, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from mader.database import CONNECT_ARGS
+from mader.models import Book, table_registry
+
+RUNS = 50
+MATCHES = 100
+
+# the filler titles are spelled from these letters only, so they share no
+# trigram with the searched words
+CONSONANTS = 'bcdfglmnprstv'
+VOWELS = 'aeiou'
+SEARCHED = 'kowaju yizeku'
+
+SEED = text("""
+    INSERT INTO books (year, title, author_id)
+    SELECT
+        1900 + g % 120,
+        (
+            SELECT string_agg(word, ' ')
+            FROM (
+                SELECT (:words)[1 + floor(random() * :vocabulary)::int]
+                FROM generate_series(1, 4)
+                WHERE g > 0
+            ) AS title (word)
+        ),
+        1
+    FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) AS g
+    ON CONFLICT (title) DO NOTHING
+""").bindparams(bindparam('words', type_=ARRAY(String)))
+
+MATCHING = text("""
+    INSERT INTO books (year, title, author_id)
+    SELECT 2000, :words || ' ' || g, 1
+    FROM generate_series(1, :matches) AS g
+""")
+
+
+def vocabulary(size: int = 2000) -> list[str]:
+    generator = random.Random(0)
+    syllables = [c + v for c in CONSONANTS for v in VOWELS]
+
+    return [
+        ''.join(generator.choices(syllables, k=generator.randint(2, 4)))
+        for _ in range(size)
+    ]
+
+
+def search_statements(substring: str):
+    # the words as typed in a search box, and with a typo for the similarity
+    # search
+    typo = f'{substring[:-1]}x'
+    rank = func.word_similarity(typo, Book.title, type_=REAL)
+
+    return {
+        'ilike': select(Book)
+        .where(Book.title.ilike(f'%{substring}%'))
+        .order_by(Book.id)
+        .limit(21),
+        'fuzzy': select(Book, rank)
+        .where(Book.title.op('%>')(typo))
+        .order_by(rank.desc(), Book.id)
+        .limit(21),
+    }
+
+
+async def median_latency(conn, stmt) -> float:
+    timings = []
+
+    for _ in range(RUNS):
+        start = perf_counter()
+        await conn.execute(stmt)
+        timings.append(perf_counter() - start)
+
+    return statistics.median(timings) * 1000
+
+
+async def main(url: str, sizes: list[int]):
+    engine = create_async_engine(url, connect_args=CONNECT_ARGS)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.drop_all)
+        await conn.run_sync(table_registry.metadata.create_all)
+        await conn.execute(text("INSERT INTO authors (name) VALUES ('a')"))
+        await conn.execute(MATCHING, {'words': SEARCHED, 'matches': MATCHES})
+
+    print(f'{"rows":>10} {"ilike (ms)":>12} {"fuzzy (ms)":>12}')
+
+    words = vocabulary()
+    statements = search_statements(SEARCHED)
+    seeded = MATCHES
+    for size in sizes:
+        async with engine.begin() as conn:
+            await conn.execute(
+                SEED,
+                {
+                    'words': words,
+                    'vocabulary': len(words),
+                    'start': seeded + 1,
+                    'stop': size,
+                },
+            )
+            await conn.execute(text('ANALYZE books'))
+        seeded = size
+
+        async with engine.connect() as conn:
+            ilike = await median_latency(conn, statements['ilike'])
+            fuzzy = await median_latency(conn, statements['fuzzy'])
+
+        print(f'{size:>10} {ilike:>12.2f} {fuzzy:>12.2f}')
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1], [int(size) for size in sys.argv[2:]]))
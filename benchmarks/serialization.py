@@ -0,0 +1,98 @@
+"""Serialization cost of a ``GET /livro/`` page.
+
+Loads one page of books both as ORM entities and as column rows, then times
+turning it into the response body the way the API used to (validating the
+entities against ``Books`` and encoding with the stdlib ``json``), through
+``from_attributes`` validation of the rows, and the current way (rows mapped
+by ``rows_as`` and encoded by pydantic-core):
+
+    python -m benchmarks.serialization postgresql+psycopg://... 20 100
+
+Only the database server is needed, the page is generated by the query, so
+no table is read or written.
+"""
+
+import asyncio
+import json
+import statistics
+import sys
+from time import perf_counter
+
+from pydantic_core import to_json
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from mader.database import CONNECT_ARGS
+from mader.models import Book
+from mader.responses import rows_as
+from mader.schemas import Books, PublicBook
+
+RUNS = 2000
+
+PAGE = text("""
+    SELECT g AS id, 1900 + g % 120 AS year, 'title ' || g AS title,
+           1 AS author_id, 1 AS version
+    FROM generate_series(1, :size) AS g
+""")
+
+
+def entities_with_stdlib(books) -> bytes:
+    body = Books.model_validate(
+        {'livros': books, 'next_cursor': 'cursor'}, from_attributes=True
+    )
+    return json.dumps(body.model_dump(mode='json')).encode()
+
+
+def rows_with_validation(rows) -> bytes:
+    body = Books.model_validate(
+        {'livros': rows, 'next_cursor': 'cursor'}, from_attributes=True
+    )
+    return body.model_dump_json().encode()
+
+
+def rows_direct(rows) -> bytes:
+    return to_json({
+        'livros': rows_as(PublicBook, rows),
+        'next_cursor': 'cursor',
+    })
+
+
+def median_cost(serialize, page) -> float:
+    timings = []
+
+    for _ in range(RUNS):
+        start = perf_counter()
+        serialize(page)
+        timings.append(perf_counter() - start)
+
+    return statistics.median(timings) * 1_000_000
+
+
+async def main(url: str, sizes: list[int]):
+    engine = create_async_engine(url, connect_args=CONNECT_ARGS)
+
+    print(
+        f'{"rows":>6} {"entities+json (us)":>20}'
+        f' {"rows+validate (us)":>20} {"rows_as (us)":>14}'
+    )
+
+    for size in sizes:
+        async with AsyncSession(engine) as session:
+            books = (
+                await session.scalars(
+                    select(Book).from_statement(PAGE), {'size': size}
+                )
+            ).all()
+            rows = (await session.execute(PAGE, {'size': size})).all()
+
+            before = median_cost(entities_with_stdlib, books)
+            validated = median_cost(rows_with_validation, rows)
+            after = median_cost(rows_direct, rows)
+
+        print(f'{size:>6} {before:>20.1f} {validated:>20.1f} {after:>14.1f}')
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1], [int(size) for size in sys.argv[2:]]))
@@ -0,0 +1,143 @@
+import asyncio
+from collections import deque
+from http import HTTPStatus
+
+from fastapi.responses import JSONResponse
+
+from mader.metrics import metrics
+from mader.settings import Settings
+
+settings = Settings()
+
+# /metrics must stay reachable under overload, and an event stream holds its
+# slot for hours while only touching the database to replay
+EXEMPT_PATHS = {'/metrics', '/metrics/', '/changes/stream'}
+
+
+def route_class(method: str, path: str) -> str | None:
+    if path in EXEMPT_PATHS:
+        return None
+    if path.rstrip('/').endswith('/export'):
+        return 'export'
+    if path.startswith('/busca'):
+        return 'search'
+    if method not in {'GET', 'HEAD'}:
+        return 'write'
+
+    return 'read'
+
+
+# a concurrency limit with a bounded, time-limited wait queue; waiters are
+# plain futures so a gate is not tied to the event loop that first used it
+class Gate:
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiters = deque()
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            self._record()
+            return True
+
+        if len(self.waiters) >= self.queue_size:
+            return self._shed('queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._record()
+
+        try:
+            # not wait_for, which may swallow a cancellation that lands
+            # after the handover
+            async with asyncio.timeout(self.timeout):
+                await waiter
+        except TimeoutError:
+            # the slot may have been handed over just as the wait expired
+            if not waiter.done() or waiter.cancelled():
+                return self._shed('timeout')
+        except asyncio.CancelledError:
+            # likewise for the client going away; the slot would otherwise
+            # stay taken for good
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self._record()
+
+        return True
+
+    def release(self):
+        # hand the slot straight to the oldest waiter, so a newcomer cannot
+        # overtake the queue
+        while self.waiters:
+            waiter = self.waiters.popleft()
+
+            if not waiter.done():
+                waiter.set_result(None)
+                self._record()
+                return
+
+        self.in_flight -= 1
+        self._record()
+
+    def _shed(self, reason: str) -> bool:
+        metrics.inc(
+            'admission_shed_total', route_class=self.name, reason=reason
+        )
+        return False
+
+    def _record(self):
+        metrics.set(
+            'admission_in_flight', self.in_flight, route_class=self.name
+        )
+        metrics.set(
+            'admission_queued', len(self.waiters), route_class=self.name
+        )
+
+
+gates = {
+    name: Gate(
+        name,
+        limit,
+        settings.ADMISSION_QUEUE_SIZE,
+        settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    )
+    for name, limit in settings.ADMISSION_LIMITS.items()
+}
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, gates: dict[str, Gate]):
+        self.app = app
+        self.gates = gates
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        gate = self.gates.get(route_class(scope['method'], scope['path']))
+
+        if gate is None:
+            return await self.app(scope, receive, send)
+
+        if not await gate.acquire():
+            response = JSONResponse(
+                {'message': 'Server busy, try again later'},
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={
+                    'Retry-After': str(settings.ADMISSION_RETRY_AFTER_SECONDS)
+                },
+            )
+            return await response(scope, receive, send)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
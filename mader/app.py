@@ -1,22 +1,72 @@
 import asyncio
 import sys
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from mader.handlers import custom_http_exception_handler
-from mader.routers import auth, authors, books, users
+from mader import database
+from mader.admission import AdmissionMiddleware, gates
+from mader.events import broker
+from mader.handlers import (
+    custom_http_exception_handler,
+    pool_timeout_handler,
+    statement_timeout_handler,
+)
+from mader.listener import listen_for_changes
+from mader.responses import FastJSONResponse
+from mader.routers import (
+    auth,
+    authors,
+    batch,
+    books,
+    changes,
+    metrics,
+    search,
+    users,
+)
+from mader.tasks import supervise
 
 if sys.platform.startswith('win'):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await database.warm_pool(database.engine)
+    tasks = [
+        asyncio.create_task(supervise('listener', listen_for_changes)),
+        asyncio.create_task(supervise('broker', broker.run)),
+    ]
+
+    yield
+
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    await database.engine.dispose()
+    await database.replicas.dispose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+app.add_middleware(AdmissionMiddleware, gates=gates)
 
 app.add_exception_handler(
     StarletteHTTPException, custom_http_exception_handler
 )
+app.add_exception_handler(OperationalError, statement_timeout_handler)
+app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
 
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(books.router)
 app.include_router(authors.router)
+app.include_router(search.router)
+app.include_router(batch.router)
+app.include_router(changes.router)
+app.include_router(metrics.router)
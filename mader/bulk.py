@@ -0,0 +1,316 @@
+import codecs
+import csv
+import json
+from collections import deque
+from collections.abc import AsyncIterator
+from http import HTTPStatus
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader.schemas import AuthorSchema, BookSchema
+from mader.settings import Settings
+
+settings = Settings()
+
+NDJSON_TYPES = {'application/x-ndjson', 'application/jsonl'}
+CSV_TYPES = {'text/csv'}
+
+
+# lines are split on the raw bytes (b'\n' never occurs inside a multi-byte
+# UTF-8 sequence) and decoded one at a time, so an invalid byte only spoils
+# its own line; utf-8-sig drops the BOM spreadsheet exports start with
+async def _read_lines(request: Request) -> AsyncIterator[tuple[str, bool]]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+
+    def decode(line: bytes, final: bool = False) -> tuple[str, bool]:
+        try:
+            return decoder.decode(line, final), True
+        except UnicodeDecodeError:
+            decoder.reset()
+            return line.decode(errors='replace'), False
+
+    buffer = b''
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+
+        for line in lines:
+            yield decode(line + b'\n')
+
+    if buffer:
+        yield decode(buffer, final=True)
+
+
+async def _read_records(
+    request: Request,
+) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    content_type = request.headers.get('content-type', '').split(';')[0]
+
+    if content_type in CSV_TYPES:
+        async for record in _read_csv(request):
+            yield record
+        return
+
+    if content_type not in NDJSON_TYPES:
+        raise HTTPException(
+            detail='Send the rows as NDJSON or CSV',
+            status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+        )
+
+    line_number = 0
+
+    async for line, decoded in _read_lines(request):
+        line_number += 1
+
+        if not decoded:
+            yield line_number, None, 'invalid UTF-8'
+            continue
+
+        if not line.strip():
+            continue
+
+        try:
+            yield line_number, json.loads(line), None
+        except json.JSONDecodeError as exc:
+            yield line_number, None, f'invalid JSON: {exc.msg}'
+
+
+# a single csv.reader parses the whole body, so quoted fields may hold line
+# breaks; it is only advanced once every quote queued for it is closed, and
+# rows are numbered by record (the header being the first) rather than by
+# line
+async def _read_csv(
+    request: Request,
+) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    lines = deque()
+    reader = csv.reader(iter(lines.popleft, None))
+    header = None
+    record = 0
+    quotes = 0
+    decoded = True
+
+    async for line, valid in _read_lines(request):
+        lines.append(line)
+        quotes += line.count('"')
+        decoded = decoded and valid
+
+        if quotes % 2:
+            continue
+
+        while lines:
+            record += 1
+
+            try:
+                values = next(reader)
+            except (csv.Error, IndexError):
+                # stray quotes left a field open past the queued lines
+                lines.clear()
+                yield record, None, 'malformed CSV'
+                continue
+
+            if not values:
+                continue
+
+            if header is None:
+                header = values
+            elif not decoded:
+                yield record, None, 'invalid UTF-8'
+            else:
+                yield record, dict(zip(header, values)), None
+
+        quotes = 0
+        decoded = True
+
+    if lines:
+        yield record + 1, None, 'unterminated quoted field'
+
+
+def _describe(exc: ValidationError) -> str:
+    error = exc.errors()[0]
+    location = '.'.join(str(part) for part in error['loc'])
+
+    return f'{location}: {error["msg"]}' if location else error['msg']
+
+
+# rows that cannot be parsed or validated are reported through `errors`
+# instead of failing the whole import
+async def validated_batches(
+    request: Request, schema: type[BaseModel], errors: list[dict]
+) -> AsyncIterator[list[tuple[int, BaseModel]]]:
+    batch = []
+
+    async for line, record, parse_error in _read_records(request):
+        if parse_error:
+            errors.append({'line': line, 'message': parse_error})
+            continue
+
+        try:
+            batch.append((line, schema.model_validate(record)))
+        except ValidationError as exc:
+            errors.append({'line': line, 'message': _describe(exc)})
+
+        if len(batch) >= settings.BULK_BATCH_SIZE:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+async def copy_rows(
+    session: AsyncSession, table: str, columns: list[str], rows: list[tuple]
+):
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+
+    async with raw_connection.driver_connection.cursor() as cursor:
+        async with cursor.copy(
+            f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+        ) as copy:
+            for row in rows:
+                await copy.write_row(row)
+
+
+BOOK_STAGING = text("""
+    CREATE TEMP TABLE book_import (
+        line integer, year integer, title text, author_id integer, status text
+    ) ON COMMIT DROP
+""")
+
+BOOK_MERGE = [
+    text("""
+        UPDATE book_import SET status = 'author_not_found'
+        WHERE NOT EXISTS (
+            SELECT 1 FROM authors WHERE authors.id = book_import.author_id
+        )
+    """),
+    text("""
+        UPDATE book_import SET status = 'conflict'
+        FROM (
+            SELECT line, row_number() OVER (PARTITION BY title ORDER BY line)
+            FROM book_import WHERE status IS NULL
+        ) AS repeated
+        WHERE book_import.line = repeated.line AND repeated.row_number > 1
+    """),
+]
+
+BOOK_INSERT = text("""
+    WITH created AS (
+        INSERT INTO books (year, title, author_id)
+        SELECT year, title, author_id FROM book_import WHERE status IS NULL
+        ON CONFLICT (title) DO NOTHING
+        RETURNING title
+    )
+    UPDATE book_import SET status = 'created'
+    FROM created
+    WHERE book_import.title = created.title AND book_import.status IS NULL
+""")
+
+BOOK_REJECTED = text("""
+    SELECT line, title, author_id, status FROM book_import
+    WHERE status IS DISTINCT FROM 'created'
+    ORDER BY line
+""")
+
+AUTHOR_STAGING = text("""
+    CREATE TEMP TABLE author_import (line integer, name text, status text)
+    ON COMMIT DROP
+""")
+
+AUTHOR_MERGE = [
+    text("""
+        UPDATE author_import SET status = 'conflict'
+        FROM (
+            SELECT line, row_number() OVER (PARTITION BY name ORDER BY line)
+            FROM author_import
+        ) AS repeated
+        WHERE author_import.line = repeated.line AND repeated.row_number > 1
+    """),
+]
+
+AUTHOR_INSERT = text("""
+    WITH created AS (
+        INSERT INTO authors (name)
+        SELECT name FROM author_import WHERE status IS NULL
+        ON CONFLICT (name) DO NOTHING
+        RETURNING name
+    )
+    UPDATE author_import SET status = 'created'
+    FROM created
+    WHERE author_import.name = created.name AND author_import.status IS NULL
+""")
+
+AUTHOR_REJECTED = text("""
+    SELECT line, name FROM author_import
+    WHERE status IS DISTINCT FROM 'created'
+    ORDER BY line
+""")
+
+
+async def import_books(session: AsyncSession, request: Request) -> dict:
+    errors = []
+    await session.execute(BOOK_STAGING)
+
+    async for batch in validated_batches(request, BookSchema, errors):
+        await copy_rows(
+            session,
+            'book_import',
+            ['line', 'year', 'title', 'author_id'],
+            [
+                (line, book.ano, book.titulo, book.romancista_id)
+                for line, book in batch
+            ],
+        )
+
+    for statement in BOOK_MERGE:
+        await session.execute(statement)
+
+    created = (await session.execute(BOOK_INSERT)).rowcount
+
+    for row in await session.execute(BOOK_REJECTED):
+        if row.status == 'author_not_found':
+            message = f'Author {row.author_id} not found'
+        else:
+            message = f'{row.title} already exist'
+
+        errors.append({'line': row.line, 'message': message})
+
+    await session.commit()
+
+    return {'created': created, 'errors': sorted(errors, key=_line)}
+
+
+async def import_authors(session: AsyncSession, request: Request) -> dict:
+    errors = []
+    await session.execute(AUTHOR_STAGING)
+
+    async for batch in validated_batches(request, AuthorSchema, errors):
+        await copy_rows(
+            session,
+            'author_import',
+            ['line', 'name'],
+            [(line, author.nome) for line, author in batch],
+        )
+
+    for statement in AUTHOR_MERGE:
+        await session.execute(statement)
+
+    created = (await session.execute(AUTHOR_INSERT)).rowcount
+
+    for row in await session.execute(AUTHOR_REJECTED):
+        errors.append({
+            'line': row.line,
+            'message': f'{row.name} already exist',
+        })
+
+    await session.commit()
+
+    return {'created': created, 'errors': sorted(errors, key=_line)}
+
+
+def _line(error: dict) -> int:
+    return error['line']
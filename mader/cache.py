@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from collections import OrderedDict
+from time import monotonic
+from typing import Protocol
+from urllib.parse import urlsplit
+
+from fastapi import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+from mader.metrics import metrics
+from mader.settings import Settings
+
+settings = Settings()
+
+
+def record_lookup(name: str, hit: bool):
+    metrics.inc(
+        'cache_hits_total' if hit else 'cache_misses_total', cache=name
+    )
+
+    hits = metrics.count('cache_hits_total', cache=name)
+    misses = metrics.count('cache_misses_total', cache=name)
+    metrics.set('cache_hit_ratio', hits / (hits + misses), cache=name)
+
+
+class TTLCache:
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self.lookup(key)
+        record_lookup(self.name, hit=value is not None)
+
+        return value
+
+    def lookup(self, key):
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] <= monotonic():
+            self._entries.pop(key, None)
+            return None
+
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        self._entries[key] = (monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            metrics.inc('cache_evictions_total', cache=self.name)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes): ...
+
+    async def delete(self, *keys: str): ...
+
+    async def clear(self): ...
+
+
+class MemoryBackend:
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.entries = TTLCache(name, max_size, ttl)
+
+    async def get(self, key: str) -> bytes | None:
+        return self.entries.lookup(key)
+
+    async def set(self, key: str, value: bytes):
+        self.entries.set(key, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.entries.pop(key)
+
+    async def clear(self):
+        self.entries.clear()
+
+
+# speaks the memcached text protocol over a small pool of connections per
+# event loop, so a slow reply only holds up its own call; a failing server
+# only turns lookups into misses, entries still expire by ttl
+class MemcachedBackend:
+    pool_size = 4
+
+    def __init__(
+        self, name: str, host: str, port: int, ttl: int, timeout: float = 0.5
+    ):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.timeout = timeout
+        self._loop = None
+        self._slots = None
+        self._idle = []
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._call(f'get {key}\r\n'.encode(), self._read_value)
+
+    async def set(self, key: str, value: bytes):
+        await self._call(
+            f'set {key} 0 {self.ttl} {len(value)}\r\n'.encode()
+            + value
+            + b'\r\n',
+            self._read_line,
+        )
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            await self._call(f'delete {key}\r\n'.encode(), self._read_line)
+
+    async def clear(self):
+        await self._call(b'flush_all\r\n', self._read_line)
+
+    async def _call(self, request: bytes, read_reply):
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._idle = []
+
+        connection = None
+
+        try:
+            # waiting for a free connection counts against the timeout too
+            async with asyncio.timeout(self.timeout), self._slots:
+                if self._idle:
+                    connection = self._idle.pop()
+                else:
+                    connection = await asyncio.open_connection(
+                        self.host, self.port
+                    )
+
+                reader, writer = connection
+                writer.write(request)
+                await writer.drain()
+                reply = await read_reply(reader)
+
+                # only a connection whose reply was read in full is reused
+                self._idle.append(connection)
+                connection = None
+
+                return reply
+        except (OSError, TimeoutError, ValueError, EOFError):
+            metrics.inc('cache_errors_total', cache=self.name)
+
+            return None
+        finally:
+            if connection is not None:
+                connection[1].close()
+
+    @staticmethod
+    async def _read_line(reader: asyncio.StreamReader) -> bytes:
+        line = await reader.readline()
+
+        if not line.endswith(b'\r\n'):
+            raise EOFError
+        if line.startswith((b'ERROR', b'CLIENT_ERROR', b'SERVER_ERROR')):
+            raise ValueError(line.decode().strip())
+
+        return line[:-2]
+
+    @classmethod
+    async def _read_value(cls, reader: asyncio.StreamReader) -> bytes | None:
+        header = await cls._read_line(reader)
+
+        if header == b'END':
+            return None
+
+        size = int(header.split()[3])
+        value = (await reader.readexactly(size + 2))[:-2]
+        await cls._read_line(reader)
+
+        return value
+
+
+def backend_from_url(
+    name: str, url: str, max_size: int, ttl: int
+) -> CacheBackend:
+    parts = urlsplit(url)
+
+    if parts.scheme == 'memcached':
+        return MemcachedBackend(name, parts.hostname, parts.port or 11211, ttl)
+
+    return MemoryBackend(name, max_size, ttl)
+
+
+# list pages are stored under a per-entity generation token, so one write
+# drops every page of that entity by replacing the token instead of
+# enumerating the stored keys; items sit under a per-entity epoch that only
+# changes when everything cached for the entity must go
+class ResponseCache:
+    def __init__(self, name: str, backend: CacheBackend):
+        self.name = name
+        self.backend = backend
+        self.invalidated_at = float('-inf')
+
+    async def item_key(self, entity: str, id: int) -> str:
+        epoch = await self._token(f'{entity}:epoch')
+
+        return f'{entity}:{epoch}:{id}'
+
+    # a page that also shows rows of other entities is stored under their
+    # generations too, so a write to any of them retires it
+    async def list_key(
+        self, entity: str, route: str, params: BaseModel, *embedded: str
+    ):
+        generation = '-'.join([
+            await self._token(f'{name}:generation')
+            for name in (entity, *embedded)
+        ])
+        normalized = json.dumps(
+            params.model_dump(mode='json', exclude_none=True), sort_keys=True
+        )
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+
+        return f'{entity}:{route}:{generation}:{digest}'
+
+    async def get(self, key: str) -> Response | None:
+        entry = await self.backend.get(key)
+        record_lookup(self.name, hit=entry is not None)
+
+        if entry is None:
+            return None
+
+        etag, _, body = entry.partition(b'\n')
+
+        return _json_response(body, etag.decode())
+
+    # a replica read right after a write may still see the old rows; stored,
+    # they would outlive the invalidation for the whole ttl, so such reads
+    # are only answered (this worker hears of every write, through its own
+    # handlers or the change listener)
+    async def store(
+        self, key: str, content, etag: str, replica: bool = False
+    ) -> Response:
+        body = to_json(content)
+        lagging = (
+            monotonic() - self.invalidated_at
+            < settings.DATABASE_REPLICA_LAG_SECONDS
+        )
+
+        if replica and lagging:
+            metrics.inc('cache_skipped_stores_total', cache=self.name)
+        else:
+            await self.backend.set(key, etag.encode() + b'\n' + body)
+
+        return _json_response(body, etag)
+
+    async def invalidate(self, entity: str, *ids: int):
+        self.invalidated_at = monotonic()
+
+        if ids:
+            epoch = await self._token(f'{entity}:epoch')
+            await self.backend.delete(
+                *(f'{entity}:{epoch}:{id}' for id in ids)
+            )
+
+        await self.backend.set(
+            f'{entity}:generation', uuid.uuid4().hex.encode()
+        )
+
+    # drops everything cached for the entities. An in-process backend is
+    # simply emptied; a shared one gets fresh tokens instead, as flushing it
+    # would also wipe the other workers' entries and whatever else lives on
+    # the same server
+    async def evict(self, *entities: str):
+        self.invalidated_at = monotonic()
+
+        if isinstance(self.backend, MemoryBackend):
+            await self.backend.clear()
+            return
+
+        for entity in entities:
+            for token in ('epoch', 'generation'):
+                await self.backend.set(
+                    f'{entity}:{token}', uuid.uuid4().hex.encode()
+                )
+
+    async def clear(self):
+        await self.backend.clear()
+
+    async def _token(self, key: str) -> str:
+        token = await self.backend.get(key)
+
+        if token is None:
+            # a fresh token instead of a counter: entries stored under an
+            # evicted token can never be served again
+            token = uuid.uuid4().hex.encode()
+            await self.backend.set(key, token)
+
+        return token.decode()
+
+
+def _json_response(body: bytes, etag: str) -> Response:
+    return Response(
+        body, media_type='application/json', headers={'ETag': etag}
+    )
+
+
+response_cache = ResponseCache(
+    'responses',
+    backend_from_url(
+        'responses',
+        settings.RESPONSE_CACHE_URL,
+        settings.RESPONSE_CACHE_MAX_SIZE,
+        settings.RESPONSE_CACHE_TTL_SECONDS,
+    ),
+)
@@ -1,10 +1,202 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+from time import monotonic, perf_counter
 
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from mader.admission import route_class
+from mader.metrics import metrics
 from mader.settings import Settings
 
-engine = create_async_engine(Settings().DATABASE_URL)
+settings = Settings()
+
+# search predicates (ILIKE, trigram similarity) only get a sensible plan when
+# the planner sees the actual pattern, so statements psycopg prepares must not
+# fall back to generic plans
+CONNECT_ARGS = {'options': '-c plan_cache_mode=force_custom_plan'}
+
+
+# times every checkout, so requests queueing for a connection show up in
+# /metrics instead of only as slow responses; the label tells the primary's
+# pool from each replica's
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    label = 'primary'
+
+    def _do_get(self):
+        start = perf_counter()
+
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc('db_pool_timeouts_total', pool=self.label)
+            raise
+        finally:
+            metrics.observe(
+                'db_pool_wait_seconds', perf_counter() - start, pool=self.label
+            )
+            self._record()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._record()
+
+    # dispose() swaps in a recreated pool, which must keep the label
+    def recreate(self):
+        pool = super().recreate()
+        pool.label = self.label
+
+        return pool
+
+    def _record(self):
+        metrics.set('db_pool_checked_out', self.checkedout(), pool=self.label)
+        metrics.set(
+            'db_pool_overflow', max(self.overflow(), 0), pool=self.label
+        )
+
+
+def create_engine(url: str, pool: str = 'primary') -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        connect_args={
+            **CONNECT_ARGS,
+            'options': (
+                f'{CONNECT_ARGS["options"]}'
+                f' -c statement_timeout={settings.STATEMENT_TIMEOUT_MS}'
+            ),
+            'prepare_threshold': settings.DATABASE_PREPARE_THRESHOLD,
+        },
+    )
+    engine.pool.label = pool
+
+    return engine
+
+
+engine = create_engine(settings.DATABASE_URL)
+
+
+# read-only handlers take the replicas in turn; a replica that cannot hand
+# out a connection is skipped for a while and the read goes to the primary
+class Replicas:
+    def __init__(self, urls: list[str], retry_seconds: float):
+        self.engines = [
+            create_engine(url, pool=f'replica-{index}')
+            for index, url in enumerate(urls)
+        ]
+        self.retry_seconds = retry_seconds
+        self._turn = 0
+        self._down_until = [0.0] * len(self.engines)
+
+    async def connect(self) -> AsyncConnection | None:
+        for _ in self.engines:
+            index = self._turn % len(self.engines)
+            self._turn += 1
+
+            if self._down_until[index] > monotonic():
+                continue
+
+            try:
+                return await self.engines[index].connect()
+            except (DBAPIError, PoolTimeoutError):
+                self._down_until[index] = monotonic() + self.retry_seconds
+                metrics.inc('db_replica_errors_total', replica=str(index))
+
+        return None
+
+    async def dispose(self):
+        for replica in self.engines:
+            await replica.dispose()
 
 
-async def get_session():
+replicas = Replicas(
+    [url for url in settings.DATABASE_REPLICA_URLS.split(',') if url],
+    settings.DATABASE_REPLICA_RETRY_SECONDS,
+)
+
+
+async def warm_pool(engine: AsyncEngine):
+    # opens the pool's base connections up front so the first requests
+    # after a deploy do not pay for the handshakes
+    connections = [engine.connect() for _ in range(engine.pool.size())]
+    await asyncio.gather(*(connection.start() for connection in connections))
+
+    for connection in connections:
+        await connection.close()
+
+
+def statement_timeout(request: Request) -> int:
+    timeouts = settings.STATEMENT_TIMEOUTS
+    endpoint = getattr(request.scope.get('endpoint'), '__name__', None)
+
+    # an entry for the handler itself overrides the one for its route class
+    if endpoint in timeouts:
+        return timeouts[endpoint]
+
+    return timeouts.get(
+        route_class(request.method, request.url.path),
+        settings.STATEMENT_TIMEOUT_MS,
+    )
+
+
+def _apply_deadline(session: AsyncSession, timeout: int):
+    # connections already start with the default timeout, so only routes
+    # that differ pay for the extra SET LOCAL at each transaction start
+    if timeout == settings.STATEMENT_TIMEOUT_MS:
+        return
+
+    @event.listens_for(session.sync_session, 'after_begin')
+    def set_timeout(session, transaction, connection):
+        connection.exec_driver_sql(
+            f'SET LOCAL statement_timeout = {int(timeout)}'
+        )
+
+
+async def get_session(request: Request):
     async with AsyncSession(engine, expire_on_commit=False) as session:
+        _apply_deadline(session, statement_timeout(request))
         yield session
+
+
+async def get_read_session(request: Request):
+    connection = await replicas.connect()
+
+    if connection is None:
+        metrics.inc('db_reads_total', target='primary')
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            _apply_deadline(session, statement_timeout(request))
+            yield session
+        return
+
+    metrics.inc('db_reads_total', target='replica')
+
+    try:
+        async with AsyncSession(
+            connection, expire_on_commit=False, info={'replica': True}
+        ) as session:
+            _apply_deadline(session, statement_timeout(request))
+            yield session
+    finally:
+        await connection.close()
+
+
+def from_replica(session: AsyncSession) -> bool:
+    return session.info.get('replica', False)
+
+
+def violated_constraint(exc: IntegrityError) -> str | None:
+    return getattr(exc.orig.diag, 'constraint_name', None)
@@ -0,0 +1,58 @@
+import hashlib
+import json
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import Header, Response
+
+IfNoneMatch = Annotated[str | None, Header()]
+
+
+def item_etag(entity: str, id: int, version: int) -> str:
+    return f'"{entity}-{id}-{version}"'
+
+
+# a page is identified by the ids and versions it holds, whether more rows
+# follow, which fields it shows and the identity of whatever its items
+# embed, which is everything its body is built from
+def list_etag(
+    rows,
+    next_cursor: str | None,
+    fields: tuple[str, ...] | None = None,
+    embedded: list | None = None,
+) -> str:
+    identity = [[row.id, row.version] for row in rows] + [next_cursor, fields]
+
+    if embedded is not None:
+        identity.append(embedded)
+
+    digest = hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+    return f'"{digest}"'
+
+
+def matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+
+    # If-None-Match uses the weak comparison
+    return '*' in candidates or etag in [
+        tag.removeprefix('W/') for tag in candidates
+    ]
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=HTTPStatus.NOT_MODIFIED, headers={'ETag': etag}
+    )
+
+
+def conditional(response: Response, if_none_match: str | None) -> Response:
+    etag = response.headers['etag']
+
+    if matches(if_none_match, etag):
+        return not_modified(etag)
+
+    return response
@@ -0,0 +1,156 @@
+import asyncio
+import json
+from contextlib import suppress
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader import database
+from mader.feed import change_entry, change_position, latest_change
+from mader.feed import read_changes as read_feed
+from mader.metrics import metrics
+from mader.pagination import encode_cursor
+from mader.settings import Settings
+
+settings = Settings()
+
+FETCH_SIZE = 100
+
+
+def _event(row) -> tuple[tuple[int, int], str]:
+    entry = change_entry(row)
+    cursor = encode_cursor(xid=row.xid, seq=row.seq)
+
+    return (row.xid, row.seq), (
+        f'id: {cursor}\n'
+        f'event: {entry["operation"]}\n'
+        f'data: {json.dumps(entry)}\n\n'
+    )
+
+
+# one per worker: woken by the change listener (and on a short poll, for
+# changes the feed horizon held back), it reads the new feed entries once
+# and hands them to every subscriber's bounded queue; a subscriber whose
+# queue is full is dropped and resumes later through Last-Event-ID
+class ChangeBroker:
+    def __init__(self, queue_size: int, poll_seconds: float):
+        self.queue_size = queue_size
+        self.poll_seconds = poll_seconds
+        self.subscribers: set[asyncio.Queue] = set()
+        self.cursor = None
+        self._wake = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.add(queue)
+        metrics.set('sse_subscribers', len(self.subscribers))
+
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        metrics.set('sse_subscribers', len(self.subscribers))
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def publish(self, position: tuple[int, int], message: str):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((position, message))
+            except asyncio.QueueFull:
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                metrics.inc('sse_dropped_total')
+
+        metrics.inc('sse_events_total')
+
+    async def fetch(self, session: AsyncSession):
+        has_more = True
+
+        while has_more:
+            rows, self.cursor, has_more = await read_feed(
+                session, self.cursor, FETCH_SIZE
+            )
+
+            for row in rows:
+                self.publish(*_event(row))
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        positioned = False
+
+        while True:
+            if positioned:
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(
+                        self._wake.wait(), self.poll_seconds
+                    )
+
+                woken = self._wake.is_set()
+                self._wake.clear()
+
+                if not (woken or self.subscribers):
+                    continue
+
+            try:
+                async with AsyncSession(database.engine) as session:
+                    if not positioned:
+                        self.cursor = await latest_change(session)
+                        positioned = True
+
+                    await self.fetch(session)
+            # database errors and pool checkout timeouts alike: the broker
+            # backs off and keeps polling, streams only miss live events
+            # until it can read again
+            except SQLAlchemyError:
+                metrics.inc('sse_fetch_errors_total')
+                await asyncio.sleep(self.poll_seconds)
+
+
+broker = ChangeBroker(settings.SSE_QUEUE_SIZE, settings.SSE_POLL_SECONDS)
+
+
+async def stream_events(session: AsyncSession, last_event_id: str | None):
+    # subscribe before replaying so nothing published meanwhile is lost;
+    # what the replay already sent is skipped by position
+    queue = broker.subscribe()
+    position = None
+
+    try:
+        cursor = last_event_id
+        has_more = bool(last_event_id)
+
+        while has_more:
+            rows, cursor, has_more = await read_feed(
+                session, cursor, FETCH_SIZE
+            )
+
+            for row in rows:
+                position, message = _event(row)
+                yield message
+
+        if last_event_id:
+            position = position or change_position(last_event_id)
+        # the stream can stay open for hours, so give the connection back
+        await session.close()
+
+        while True:
+            try:
+                item = await asyncio.wait_for(
+                    queue.get(), settings.SSE_KEEPALIVE_SECONDS
+                )
+            except TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+
+            if item is None:
+                return
+
+            if position is None or item[0] > position:
+                yield item[1]
+    finally:
+        broker.unsubscribe(queue)
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader.settings import Settings
+
+settings = Settings()
+
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+# rows come from a server-side cursor one partition at a time, so only
+# EXPORT_BATCH_SIZE rows and their encoded chunk are held in memory at once
+async def export_rows(
+    session: AsyncSession, stmt: Select, formato: str
+) -> AsyncIterator[str]:
+    result = await session.stream(
+        stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+    )
+    columns = list(result.keys())
+
+    try:
+        if formato == 'csv':
+            yield _encode_csv([columns])
+
+        async for partition in result.partitions():
+            if formato == 'csv':
+                yield _encode_csv(partition)
+            else:
+                yield ''.join(
+                    f'{json.dumps(dict(zip(columns, row)))}\n'
+                    for row in partition
+                )
+    finally:
+        await result.close()
+
+
+def _encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+
+    return buffer.getvalue()
+
+
+def export_response(
+    session: AsyncSession, stmt: Select, formato: str, filename: str
+) -> StreamingResponse:
+    return StreamingResponse(
+        export_rows(session, stmt, formato),
+        media_type=MEDIA_TYPES[formato],
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}.{formato}'
+        },
+    )
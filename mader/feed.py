@@ -0,0 +1,106 @@
+from sqlalchemy import BigInteger, Text, and_, cast, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader.models import Author, Book, Change
+from mader.pagination import decode_cursor, encode_cursor
+
+# the sequence alone is not safe to resume from: a transaction can draw a
+# lower seq and commit after a higher one was served. Only changes from
+# transactions older than every running one are listed, ordered by (xid,
+# seq), so nothing can later appear behind a cursor already handed out
+HORIZON = cast(
+    cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), Text), BigInteger
+)
+
+
+def change_position(cursor: str) -> tuple[int, int]:
+    return decode_cursor(cursor, 'xid', 'seq')
+
+
+async def read_changes(
+    session: AsyncSession, since: str | None, size: int
+) -> tuple[list, str | None, bool]:
+    stmt = (
+        select(
+            Change.entity,
+            Change.entity_id,
+            Change.deleted,
+            Change.xid,
+            Change.seq,
+            Book.year,
+            Book.title,
+            Book.author_id,
+            Author.name,
+            func.coalesce(Book.version, Author.version).label('version'),
+        )
+        .outerjoin(
+            Book, and_(Change.entity == 'books', Book.id == Change.entity_id)
+        )
+        .outerjoin(
+            Author,
+            and_(Change.entity == 'authors', Author.id == Change.entity_id),
+        )
+        .where(Change.xid < HORIZON)
+        .order_by(Change.xid, Change.seq)
+        .limit(size + 1)
+    )
+
+    if since:
+        stmt = stmt.where(
+            tuple_(Change.xid, Change.seq) > tuple_(*change_position(since))
+        )
+
+    rows = (await session.execute(stmt)).all()
+    page = rows[:size]
+    next_cursor = since
+
+    if page:
+        next_cursor = encode_cursor(xid=page[-1].xid, seq=page[-1].seq)
+
+    return page, next_cursor, len(rows) > size
+
+
+async def latest_change(session: AsyncSession) -> str | None:
+    row = (
+        await session.execute(
+            select(Change.xid, Change.seq)
+            .where(Change.xid < HORIZON)
+            .order_by(Change.xid.desc(), Change.seq.desc())
+            .limit(1)
+        )
+    ).one_or_none()
+
+    return encode_cursor(xid=row.xid, seq=row.seq) if row else None
+
+
+def change_entry(row) -> dict:
+    change = {
+        'entity': row.entity,
+        'id': row.entity_id,
+        'operation': _operation(row),
+        'deleted': row.deleted,
+    }
+
+    if row.deleted:
+        return change
+
+    if row.entity == 'books':
+        change['livro'] = {
+            'id': row.entity_id,
+            'year': row.year,
+            'title': row.title,
+            'author_id': row.author_id,
+        }
+    else:
+        change['romancista'] = {'id': row.entity_id, 'name': row.name}
+
+    return change
+
+
+def _operation(row) -> str:
+    if row.deleted:
+        return 'delete'
+
+    # an entry keeps only the latest state, so a row created and edited
+    # before it was read is reported as an update
+    return 'create' if row.version == 1 else 'update'
@@ -1,7 +1,17 @@
+from http import HTTPStatus
+
 from fastapi import Request
 from fastapi.responses import JSONResponse
+from psycopg.errors import QueryCanceled
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
+from mader.metrics import metrics
+from mader.settings import Settings
+
+settings = Settings()
+
 
 async def custom_http_exception_handler(
     request: Request, exc: StarletteHTTPException
@@ -9,4 +19,34 @@ async def custom_http_exception_handler(
     return JSONResponse(
         status_code=exc.status_code,
         content={'message': exc.detail},
+        headers=exc.headers,
+    )
+
+
+def _route(request: Request) -> str:
+    route = request.scope.get('route')
+
+    return getattr(route, 'path', request.url.path)
+
+
+async def statement_timeout_handler(request: Request, exc: OperationalError):
+    if not isinstance(exc.orig, QueryCanceled):
+        raise exc
+
+    metrics.inc('statement_timeouts_total', route=_route(request))
+
+    return JSONResponse(
+        status_code=HTTPStatus.GATEWAY_TIMEOUT,
+        content={'message': 'Query took too long, try a narrower request'},
+    )
+
+
+# the pool already counts its timeouts
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={'message': 'Server busy, try again later'},
+        headers={
+            'Retry-After': str(settings.DATABASE_POOL_RETRY_AFTER_SECONDS)
+        },
     )
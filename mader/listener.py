@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import psycopg
+
+from mader import database
+from mader.cache import response_cache
+from mader.events import broker
+from mader.metrics import metrics
+from mader.security import user_cache
+from mader.settings import Settings
+
+settings = Settings()
+
+CHANNEL = 'mader_changes'
+CACHED_ENTITIES = ('books', 'authors')
+
+
+async def apply_change(payload: str):
+    change = json.loads(payload)
+    entity, ids = change['entity'], change['ids']
+
+    metrics.inc('change_notifications_total', entity=entity)
+
+    if entity in {'books', 'authors'}:
+        broker.wake()
+
+    if entity == 'users':
+        if ids is None:
+            user_cache.clear()
+
+        for id in ids or []:
+            user_cache.pop(id)
+    elif ids is None:
+        await response_cache.evict(entity)
+    else:
+        await response_cache.invalidate(entity, *ids)
+
+
+async def evict_all():
+    user_cache.clear()
+    await response_cache.evict(*CACHED_ENTITIES)
+
+
+# one dedicated connection per worker; notifications sent while it was down
+# are lost, so every (re)connect starts from empty caches
+async def listen_for_changes():
+    url = database.engine.url.set(drivername='postgresql')
+    conninfo = url.render_as_string(hide_password=False)
+
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                conninfo, autocommit=True
+            ) as conn:
+                await conn.execute(f'LISTEN {CHANNEL}')
+                await evict_all()
+                metrics.set('change_listener_connected', 1)
+
+                try:
+                    async for notify in conn.notifies():
+                        await apply_change(notify.payload)
+                finally:
+                    metrics.set('change_listener_connected', 0)
+        except psycopg.OperationalError:
+            metrics.inc('change_listener_reconnects_total')
+            await asyncio.sleep(settings.CHANGE_LISTENER_RETRY_SECONDS)
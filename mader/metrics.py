@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+
+def _key(name: str, labels: dict[str, str]) -> str:
+    if not labels:
+        return name
+
+    rendered = ','.join(f'{label}={value}' for label, value in labels.items())
+    return f'{name}{{{rendered}}}'
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: dict[str, int] = defaultdict(int)
+        self.gauges: dict[str, float] = {}
+        self.timings: dict[str, dict[str, float]] = {}
+
+    def inc(self, name: str, value: int = 1, **labels: str):
+        self.counters[_key(name, labels)] += value
+
+    def count(self, name: str, **labels: str) -> int:
+        return self.counters.get(_key(name, labels), 0)
+
+    def set(self, name: str, value: float, **labels: str):
+        self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        timing = self.timings.setdefault(
+            _key(name, labels), {'count': 0, 'sum': 0.0, 'max': 0.0}
+        )
+        timing['count'] += 1
+        timing['sum'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'timings': {name: dict(t) for name, t in self.timings.items()},
+        }
+
+
+metrics = Metrics()
@@ -1,8 +1,19 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import DDL, BigInteger, ForeignKey, Index, Sequence, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, registry, relationship
 
 table_registry = registry()
 
+event.listen(
+    table_registry.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'),
+)
+
+# the GIN indexes backing the searches are created with fastupdate off, so
+# searches never have to scan an unmerged pending list
+GIN_OPTIONS = {'fastupdate': 'off'}
+
 
 @table_registry.mapped_as_dataclass
 class User:
@@ -17,22 +28,274 @@ class User:
 @table_registry.mapped_as_dataclass
 class Author:
     __tablename__ = 'authors'
+    __table_args__ = (
+        Index(
+            'ix_authors_name_trgm',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+            postgresql_with=GIN_OPTIONS,
+        ),
+    )
 
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
     name: Mapped[str] = mapped_column(unique=True)
+    version: Mapped[int] = mapped_column(
+        init=False, default=1, server_default='1'
+    )
 
+    # never loaded implicitly: a lazy load cannot run under async, so the
+    # books are read with explicit queries and touching this raises instead
     books: Mapped[list['Book']] = relationship(
-        init=False, back_populates='author', cascade='all, delete-orphan'
+        init=False,
+        back_populates='author',
+        cascade='all, delete-orphan',
+        passive_deletes=True,
+        lazy='raise',
+        repr=False,
     )
 
 
 @table_registry.mapped_as_dataclass
 class Book:
     __tablename__ = 'books'
+    __table_args__ = (
+        Index(
+            'ix_books_title_trgm',
+            'title',
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'},
+            postgresql_with=GIN_OPTIONS,
+        ),
+        Index('ix_books_year_title', 'year', 'title'),
+        Index(
+            'ix_books_search_vector',
+            'search_vector',
+            postgresql_using='gin',
+            postgresql_with=GIN_OPTIONS,
+        ),
+    )
 
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
-    year: Mapped[str] = mapped_column()
+    year: Mapped[int] = mapped_column()
     title: Mapped[str] = mapped_column(unique=True)
-    author_id: Mapped[int] = mapped_column(ForeignKey('authors.id'))
+    author_id: Mapped[int] = mapped_column(
+        ForeignKey('authors.id', ondelete='CASCADE'), index=True
+    )
+    version: Mapped[int] = mapped_column(
+        init=False, default=1, server_default='1'
+    )
+    # maintained by the triggers below from the title and the author name
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR, init=False, deferred=True, repr=False
+    )
+
+    author: Mapped[Author] = relationship(
+        init=False, back_populates='books', lazy='raise', repr=False
+    )
+
+
+SEARCH_VECTOR_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION books_search_vector_update() RETURNS trigger
+    AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', NEW.title), 'A')
+            || setweight(to_tsvector('simple', coalesce(
+                (SELECT name FROM authors WHERE id = NEW.author_id), ''
+            )), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER books_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, author_id ON books
+    FOR EACH ROW EXECUTE FUNCTION books_search_vector_update()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION authors_search_vector_update() RETURNS trigger
+    AS $$
+    BEGIN
+        UPDATE books
+        SET search_vector =
+            setweight(to_tsvector('simple', title), 'A')
+            || setweight(to_tsvector('simple', NEW.name), 'B')
+        WHERE author_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER authors_search_vector_update
+    AFTER UPDATE OF name ON authors
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION authors_search_vector_update()
+    """,
+]
+
+for statement in SEARCH_VECTOR_TRIGGERS:
+    event.listen(Book.__table__, 'after_create', DDL(statement))
+
+# version only moves when a field of the public representation changes, so
+# it can back the ETags; trigger-driven updates such as search_vector leave it
+VERSION_FUNCTION = """
+    CREATE OR REPLACE FUNCTION bump_version() RETURNS trigger AS $$
+    BEGIN
+        NEW.version := OLD.version + 1;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+VERSION_TRIGGERS = {
+    Author: """
+        CREATE TRIGGER authors_bump_version
+        BEFORE UPDATE OF name ON authors
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+        EXECUTE FUNCTION bump_version()
+    """,
+    Book: """
+        CREATE TRIGGER books_bump_version
+        BEFORE UPDATE OF year, title, author_id ON books
+        FOR EACH ROW WHEN (
+            (OLD.year, OLD.title, OLD.author_id)
+            IS DISTINCT FROM (NEW.year, NEW.title, NEW.author_id)
+        )
+        EXECUTE FUNCTION bump_version()
+    """,
+}
+
+event.listen(table_registry.metadata, 'before_create', DDL(VERSION_FUNCTION))
+
+for model, statement in VERSION_TRIGGERS.items():
+    event.listen(model.__table__, 'after_create', DDL(statement))
+
+# every committed write to users, authors or books is announced on the
+# mader_changes channel so each worker can evict its local caches; inserts
+# only carry the entity (no cached item can exist yet) and statements
+# touching more than 100 rows send null ids, meaning "evict everything"
+CHANGE_NOTIFY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION notify_changes() RETURNS trigger AS $$
+    DECLARE
+        ids integer[];
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+
+        IF TG_OP = 'INSERT' THEN
+            ids := '{}';
+        ELSE
+            SELECT array_agg(id) INTO ids
+            FROM (SELECT id FROM changed_rows LIMIT 101) AS changed;
+        END IF;
+
+        PERFORM pg_notify('mader_changes', json_build_object(
+            'entity', TG_TABLE_NAME,
+            'ids', CASE WHEN cardinality(ids) > 100 THEN NULL ELSE ids END
+        )::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def change_notify_triggers(table: str) -> list[str]:
+    return [
+        f"""
+        CREATE TRIGGER {table}_notify_{operation.lower()}
+        AFTER {operation} ON {table}
+        REFERENCING {rows} TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_changes()
+        """
+        for operation, rows in (
+            ('INSERT', 'NEW'),
+            ('UPDATE', 'NEW'),
+            ('DELETE', 'OLD'),
+        )
+    ]
+
+
+event.listen(
+    table_registry.metadata, 'before_create', DDL(CHANGE_NOTIFY_FUNCTION)
+)
+
+for model in (User, Author, Book):
+    for statement in change_notify_triggers(model.__tablename__):
+        event.listen(model.__table__, 'after_create', DDL(statement))
+
+CHANGES_SEQ = Sequence('changes_seq', metadata=table_registry.metadata)
+
+
+# one row per book or author holding its latest change, tombstones included;
+# (xid, seq) orders the feed, see mader/routers/changes.py
+@table_registry.mapped_as_dataclass
+class Change:
+    __tablename__ = 'changes'
+    __table_args__ = (Index('ix_changes_xid_seq', 'xid', 'seq'),)
+
+    entity: Mapped[str] = mapped_column(primary_key=True)
+    entity_id: Mapped[int] = mapped_column(primary_key=True)
+    deleted: Mapped[bool] = mapped_column()
+    xid: Mapped[int] = mapped_column(BigInteger)
+    seq: Mapped[int] = mapped_column(
+        BigInteger, CHANGES_SEQ, server_default=CHANGES_SEQ.next_value()
+    )
+
+
+# updates only log rows whose version moved, so the search_vector refresh
+# after an author rename does not flood the feed with unchanged books
+CHANGE_LOG_FUNCTION = """
+    CREATE OR REPLACE FUNCTION record_changes() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            INSERT INTO changes (entity, entity_id, deleted, xid, seq)
+            SELECT TG_TABLE_NAME, changed.id, false,
+                   pg_current_xact_id()::text::bigint, nextval('changes_seq')
+            FROM changed_rows AS changed
+            JOIN old_rows AS previous ON previous.id = changed.id
+            WHERE previous.version <> changed.version
+            ORDER BY changed.id
+            ON CONFLICT (entity, entity_id) DO UPDATE
+            SET deleted = false, xid = EXCLUDED.xid, seq = EXCLUDED.seq;
+        ELSE
+            INSERT INTO changes (entity, entity_id, deleted, xid, seq)
+            SELECT TG_TABLE_NAME, id, TG_OP = 'DELETE',
+                   pg_current_xact_id()::text::bigint, nextval('changes_seq')
+            FROM changed_rows
+            ORDER BY id
+            ON CONFLICT (entity, entity_id) DO UPDATE
+            SET deleted = EXCLUDED.deleted, xid = EXCLUDED.xid,
+                seq = EXCLUDED.seq;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def change_log_triggers(table: str) -> list[str]:
+    return [
+        f"""
+        CREATE TRIGGER {table}_log_{operation.lower()}
+        AFTER {operation} ON {table}
+        REFERENCING {rows}
+        FOR EACH STATEMENT EXECUTE FUNCTION record_changes()
+        """
+        for operation, rows in (
+            ('INSERT', 'NEW TABLE AS changed_rows'),
+            ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS changed_rows'),
+            ('DELETE', 'OLD TABLE AS changed_rows'),
+        )
+    ]
+
+
+event.listen(
+    table_registry.metadata, 'before_create', DDL(CHANGE_LOG_FUNCTION)
+)
 
-    author: Mapped[Author] = relationship(init=False, back_populates='books')
+for model in (Author, Book):
+    for statement in change_log_triggers(model.__tablename__):
+        event.listen(model.__table__, 'after_create', DDL(statement))
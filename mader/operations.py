@@ -0,0 +1,178 @@
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader.database import violated_constraint
+from mader.models import Author, Book
+from mader.schemas import AuthorSchema, BookSchema, BookUpdate
+
+# the writes behind the book and author endpoints and /batch; they neither
+# commit nor roll back, so a caller can group several in one transaction or
+# run each in a savepoint, and a failure leaves the transaction to the
+# caller (the session is discarded with it on error)
+#
+# updates reload the row they return with populate_existing, as the version
+# bumped by the trigger is not one of the values set
+
+
+async def create_book(session: AsyncSession, book: BookSchema) -> Book:
+    stmt = (
+        insert(Book)
+        .values(
+            year=book.ano,
+            title=book.titulo,
+            author_id=book.romancista_id,
+        )
+        .on_conflict_do_nothing(index_elements=[Book.title])
+        .returning(Book)
+    )
+
+    try:
+        new_book = await session.scalar(stmt)
+    except IntegrityError as exc:
+        raise _book_integrity_error(exc, book.titulo, book.romancista_id)
+
+    if not new_book:
+        raise HTTPException(
+            detail=f'{book.titulo} already exist',
+            status_code=HTTPStatus.CONFLICT,
+        )
+
+    return new_book
+
+
+# also tells whether anything was set, as an empty update leaves the book
+# and its cached copies as they were
+async def update_book(
+    session: AsyncSession, id: int, book: BookUpdate
+) -> tuple[Book, bool]:
+    values = {}
+
+    if book.ano:
+        values['year'] = book.ano
+
+    if book.titulo:
+        values['title'] = book.titulo
+
+    if book.romancista_id:
+        values['author_id'] = book.romancista_id
+
+    if values:
+        stmt = (
+            update(Book)
+            .where(Book.id == id)
+            .values(**values)
+            .returning(Book)
+            .execution_options(populate_existing=True)
+        )
+    else:
+        stmt = select(Book).where(Book.id == id)
+
+    try:
+        current_book = await session.scalar(stmt)
+    except IntegrityError as exc:
+        raise _book_integrity_error(exc, book.titulo, book.romancista_id)
+
+    if not current_book:
+        raise HTTPException(
+            detail='Book not exist',
+            status_code=HTTPStatus.NOT_FOUND,
+        )
+
+    return current_book, bool(values)
+
+
+async def delete_book(session: AsyncSession, id: int):
+    deleted = await session.scalar(
+        delete(Book).where(Book.id == id).returning(Book.id)
+    )
+
+    if not deleted:
+        raise HTTPException(
+            detail='Book not exist', status_code=HTTPStatus.NOT_FOUND
+        )
+
+
+def _book_integrity_error(
+    exc: IntegrityError, title: str | None, author_id: int | None
+) -> HTTPException:
+    if violated_constraint(exc) == 'books_author_id_fkey':
+        return HTTPException(
+            detail=f'Author {author_id} not found',
+            status_code=HTTPStatus.NOT_FOUND,
+        )
+
+    return HTTPException(
+        detail=f'{title} already exist',
+        status_code=HTTPStatus.CONFLICT,
+    )
+
+
+async def create_author(session: AsyncSession, author: AuthorSchema) -> Author:
+    new_author = await session.scalar(
+        insert(Author)
+        .values(name=author.nome)
+        .on_conflict_do_nothing(index_elements=[Author.name])
+        .returning(Author)
+    )
+
+    if not new_author:
+        raise HTTPException(
+            detail=f'{author.nome} already exist',
+            status_code=HTTPStatus.CONFLICT,
+        )
+
+    return new_author
+
+
+async def update_author(
+    session: AsyncSession, id: int, author: AuthorSchema
+) -> Author:
+    try:
+        current_author = await session.scalar(
+            update(Author)
+            .where(Author.id == id)
+            .values(name=author.nome)
+            .returning(Author)
+            .execution_options(populate_existing=True)
+        )
+    except IntegrityError:
+        raise HTTPException(
+            detail=f'{author.nome} already exist',
+            status_code=HTTPStatus.CONFLICT,
+        )
+
+    if not current_author:
+        raise HTTPException(
+            detail='Author not exist', status_code=HTTPStatus.NOT_FOUND
+        )
+
+    return current_author
+
+
+# returns the ids of the books the cascade removed, read in the same
+# statement, for their cached copies to be dropped
+async def delete_author(session: AsyncSession, id: int) -> list[int]:
+    book_ids = (
+        select(func.array_agg(Book.id))
+        .where(Book.author_id == id)
+        .scalar_subquery()
+    )
+    deleted = (
+        await session.execute(
+            delete(Author)
+            .where(Author.id == id)
+            .returning(Author.id, book_ids.label('book_ids'))
+        )
+    ).one_or_none()
+
+    if not deleted:
+        raise HTTPException(
+            detail='Author not exist', status_code=HTTPStatus.NOT_FOUND
+        )
+
+    return deleted.book_ids or []
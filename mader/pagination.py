@@ -0,0 +1,92 @@
+import binascii
+import json
+from base64 import b32decode, b32encode
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from sqlalchemy import Select, and_, cast, or_
+
+from mader.settings import Settings
+
+settings = Settings()
+
+
+def encode_cursor(**values: int | float) -> str:
+    raw = json.dumps(values, separators=(',', ':')).encode()
+
+    # base32 keeps the cursor opaque and survives the lowercasing applied by
+    # the filter schemas
+    return b32encode(raw).decode().rstrip('=').lower()
+
+
+def decode_cursor(cursor: str, *keys: str) -> tuple[int | float, ...]:
+    invalid_cursor = HTTPException(
+        detail='Invalid cursor', status_code=HTTPStatus.BAD_REQUEST
+    )
+
+    try:
+        padded = cursor.upper() + '=' * (-len(cursor) % 8)
+        values = json.loads(b32decode(padded))
+    except (binascii.Error, ValueError):
+        raise invalid_cursor
+
+    if not isinstance(values, dict):
+        raise invalid_cursor
+
+    decoded = tuple(values.get(key) for key in keys)
+
+    for value in decoded:
+        if isinstance(value, bool) or not isinstance(value, int | float):
+            raise invalid_cursor
+
+    return decoded
+
+
+def page_size(limit: int | None) -> int:
+    return min(limit or settings.PAGE_SIZE, settings.MAX_PAGE_SIZE)
+
+
+def paginate(stmt: Select, id_column, filter, rank=None) -> tuple[Select, int]:
+    size = page_size(filter.limit)
+    stmt = stmt.limit(size + 1)
+
+    if rank is None:
+        stmt = stmt.order_by(id_column)
+    else:
+        stmt = stmt.order_by(rank.desc(), id_column)
+
+    if not filter.cursor:
+        return stmt.offset((filter.page - 1) * size), size
+
+    if rank is None:
+        (last_id,) = decode_cursor(filter.cursor, 'id')
+        return stmt.where(id_column > last_id), size
+
+    last_rank, last_id = decode_cursor(filter.cursor, 'rank', 'id')
+    # ranks travel through the cursor as text; cast back to the rank type so
+    # equal ranks still compare equal
+    last_rank = cast(last_rank, rank.type)
+    stmt = stmt.where(
+        or_(rank < last_rank, and_(rank == last_rank, id_column > last_id))
+    )
+
+    return stmt, size
+
+
+def id_cursor(row) -> dict:
+    return {'id': row.id}
+
+
+def rank_cursor(row) -> dict:
+    return {'rank': row.rank, 'id': row.id}
+
+
+def page_results(
+    rows, size: int, cursor_values=id_cursor
+) -> tuple[list, str | None]:
+    rows = list(rows)
+
+    if len(rows) <= size:
+        return rows, None
+
+    return rows[:size], encode_cursor(**cursor_values(rows[size - 1]))
@@ -0,0 +1,86 @@
+import hashlib
+from http import HTTPStatus
+from math import ceil
+from time import time
+
+from fastapi import HTTPException, Request
+
+from mader.cache import CacheBackend, backend_from_url
+from mader.metrics import metrics
+from mader.settings import Settings
+
+settings = Settings()
+
+
+# a bucket is stored as 'tokens updated_at' in a cache backend, so workers
+# can share buckets through memcached; the read-modify-write is not atomic
+# there, which at worst lets a few extra attempts through under contention.
+# A bucket that is missing (never used, expired or unreachable) is full
+class TokenBucket:
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.backend: CacheBackend = backend_from_url(
+            f'rate_limit_{name}',
+            settings.RATE_LIMIT_URL,
+            settings.RATE_LIMIT_MAX_KEYS,
+            ceil(burst / self.rate),
+        )
+
+    async def take(self, key: str) -> float:
+        key = f'rate:{self.name}:{hashlib.sha1(key.encode()).hexdigest()}'
+        now = time()
+        tokens = self.burst
+        entry = await self.backend.get(key)
+
+        if entry is not None:
+            stored, updated = (float(value) for value in entry.split())
+            tokens = min(self.burst, stored + (now - updated) * self.rate)
+
+        if tokens < 1:
+            metrics.inc(
+                'rate_limit_decisions_total',
+                limiter=self.name,
+                decision='deny',
+            )
+            return (1 - tokens) / self.rate
+
+        await self.backend.set(key, f'{tokens - 1} {now}'.encode())
+        metrics.inc(
+            'rate_limit_decisions_total', limiter=self.name, decision='allow'
+        )
+
+        return 0.0
+
+    async def clear(self):
+        await self.backend.clear()
+
+
+ip_limiter = TokenBucket(
+    'ip', settings.RATE_LIMIT_IP_PER_MINUTE, settings.RATE_LIMIT_IP_BURST
+)
+account_limiter = TokenBucket(
+    'account',
+    settings.RATE_LIMIT_ACCOUNT_PER_MINUTE,
+    settings.RATE_LIMIT_ACCOUNT_BURST,
+)
+
+
+# runs before any password hashing, so a burst of attempts is turned away
+# without costing an Argon2 computation
+async def limit_attempts(request: Request, route: str, account: str):
+    client = request.client.host if request.client else 'unknown'
+
+    for limiter, key in (
+        (ip_limiter, client),
+        (account_limiter, account.strip().lower()),
+    ):
+        retry_after = await limiter.take(f'{route}:{key}')
+
+        if retry_after:
+            raise HTTPException(
+                detail='Too many attempts, try again later',
+                status_code=HTTPStatus.TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(ceil(retry_after))},
+            )
@@ -0,0 +1,71 @@
+from operator import itemgetter
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+from sqlalchemy import Integer, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# pydantic-core's Rust encoder, already installed with pydantic, in place of
+# the stdlib json.dumps
+class FastJSONResponse(JSONResponse):
+    @staticmethod
+    def render(content) -> bytes:
+        return to_json(content)
+
+
+# builds response items straight from result rows: the columns already
+# carry the model's types, and validating each Row through from_attributes
+# costs more than serializing the whole page
+def rows_as(
+    model: type[BaseModel], rows, fields: tuple[str, ...] | None = None
+) -> list[dict]:
+    if not rows:
+        return []
+
+    fields = fields or tuple(model.model_fields)
+    indexes = [rows[0]._fields.index(field) for field in fields]
+    # the repeated index keeps itemgetter returning a tuple even for a single
+    # field; zip stops before the extra value
+    values = itemgetter(*indexes, indexes[0])
+
+    return [dict(zip(fields, values(row))) for row in rows]
+
+
+def row_as(model: type[BaseModel], row) -> dict:
+    return rows_as(model, [row])[0]
+
+
+# the entity's columns for the requested fields (all of the model's when
+# none were asked for) plus those the handler needs itself, e.g. the id for
+# the cursor and the version for the ETag
+def project(
+    entity, model: type[BaseModel], fields: tuple[str, ...] | None, *required
+) -> tuple:
+    names = dict.fromkeys((*(fields or model.model_fields), *required))
+
+    return tuple(getattr(entity, name) for name in names)
+
+
+# the items for the requested ids in the order they were asked for, and the
+# ids no row was found for
+async def read_by_ids(
+    session: AsyncSession,
+    entity,
+    model: type[BaseModel],
+    ids: tuple[int, ...],
+) -> tuple[list[dict], list[int]]:
+    # a single array parameter, so every batch size shares one statement
+    rows = await session.execute(
+        select(*project(entity, model, None)).where(
+            entity.id == any_(bindparam('ids', list(ids), ARRAY(Integer)))
+        )
+    )
+    found = {item['id']: item for item in rows_as(model, rows.all())}
+
+    return (
+        [found[id] for id in ids if id in found],
+        [id for id in ids if id not in found],
+    )
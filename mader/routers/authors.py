@@ -1,76 +1,350 @@
 from http import HTTPStatus
+from itertools import groupby
+from operator import attrgetter
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import (
+    REAL,
+    Select,
+    and_,
+    func,
+    select,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from mader.database import get_session
-from mader.models import Author, User
+from mader import operations
+from mader.bulk import import_authors
+from mader.cache import response_cache
+from mader.database import from_replica, get_read_session, get_session
+from mader.etag import (
+    IfNoneMatch,
+    conditional,
+    item_etag,
+    list_etag,
+    matches,
+    not_modified,
+)
+from mader.export import export_response
+from mader.models import Author, Book, User
+from mader.pagination import (
+    decode_cursor,
+    encode_cursor,
+    id_cursor,
+    page_results,
+    page_size,
+    paginate,
+    rank_cursor,
+)
+from mader.responses import (
+    FastJSONResponse,
+    project,
+    read_by_ids,
+    row_as,
+    rows_as,
+)
 from mader.schemas import (
+    AuthorBatch,
+    AuthorBooks,
     Authors,
     AuthorSchema,
+    BatchIds,
+    BulkResult,
+    ExportAuthor,
     FilterAuthor,
+    FilterAuthorBooks,
     Message,
     PublicAuthor,
+    PublicBook,
 )
 from mader.security import get_current_user
+from mader.settings import Settings
+
+settings = Settings()
 
 router = APIRouter(prefix='/romancista', tags=['authors'])
 
 CurrentUser = Annotated[User, Depends(get_current_user)]
 Session = Annotated[AsyncSession, Depends(get_session)]
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
 
 
 @router.get('/', response_model=Authors)
 async def filter_author(
-    session: Session, filter: Annotated[FilterAuthor, Query()]
+    session: ReadSession,
+    filter: Annotated[FilterAuthor, Query()],
+    if_none_match: IfNoneMatch = None,
 ):
-    offset = (filter.page - 1) * 20
-    limit = filter.page * 20
+    # the embedded books come from the books table, so their writes must
+    # retire the page too
+    key = await response_cache.list_key(
+        'authors',
+        'filter_author',
+        filter,
+        *(['books'] if filter.include else []),
+    )
+    cached = await response_cache.get(key)
+
+    if cached:
+        return conditional(cached, if_none_match)
+
+    if if_none_match and not filter.include:
+        versions, next_cursor = await _author_page(
+            session, filter, Author.id, Author.version
+        )
+        etag = list_etag(versions, next_cursor, filter.fields)
+
+        if matches(if_none_match, etag):
+            return not_modified(etag)
+
+    authors, next_cursor = await _author_page(
+        session,
+        filter,
+        *project(Author, PublicAuthor, filter.fields, 'id', 'version'),
+    )
+    items = rows_as(PublicAuthor, authors, filter.fields)
+
+    if not filter.include:
+        return await response_cache.store(
+            key,
+            {'romancistas': items, 'next_cursor': next_cursor},
+            list_etag(authors, next_cursor, filter.fields),
+            replica=from_replica(session),
+        )
+
+    embedded, books = await _embedded_books(
+        session, [author.id for author in authors]
+    )
+
+    for item, author in zip(items, authors):
+        item.update(embedded[author.id])
+
+    response = await response_cache.store(
+        key,
+        {'romancistas': items, 'next_cursor': next_cursor},
+        list_etag(
+            authors,
+            next_cursor,
+            filter.fields,
+            [[book.id, book.version, book.total] for book in books],
+        ),
+        replica=from_replica(session),
+    )
+
+    return conditional(response, if_none_match)
+
+
+# the first books of every author on the page, with each author's book
+# count, in one statement: the window numbers the books per author, so the
+# page costs two queries however many authors it holds
+async def _embedded_books(
+    session: AsyncSession, author_ids: list[int]
+) -> tuple[dict[int, dict], list]:
+    size = settings.EMBEDDED_BOOKS_LIMIT
+    embedded = {
+        id: {'livros': [], 'livros_count': 0, 'livros_next_cursor': None}
+        for id in author_ids
+    }
+
+    if not author_ids:
+        return embedded, []
+
+    ranked = (
+        select(
+            *project(Book, PublicBook, None, 'version'),
+            func
+            .row_number()
+            .over(partition_by=Book.author_id, order_by=Book.id)
+            .label('position'),
+            func.count().over(partition_by=Book.author_id).label('total'),
+        )
+        .where(Book.author_id.in_(author_ids))
+        .subquery()
+    )
+    books = (
+        await session.execute(
+            select(ranked)
+            .where(ranked.c.position <= size)
+            .order_by(ranked.c.author_id, ranked.c.id)
+        )
+    ).all()
+
+    for author_id, rows in groupby(books, attrgetter('author_id')):
+        group = list(rows)
+        total = group[0].total
+        embedded[author_id] = {
+            'livros': rows_as(PublicBook, group),
+            'livros_count': total,
+            # continues at GET /romancista/{id}/livros
+            'livros_next_cursor': (
+                encode_cursor(**id_cursor(group[-1])) if total > size else None
+            ),
+        }
+
+    return embedded, books
+
+
+async def _author_page(session: AsyncSession, filter: FilterAuthor, *columns):
+    rank = None
 
-    stmt = select(Author)
+    if filter.fuzzy and filter.nome:
+        rank = func.word_similarity(filter.nome, Author.name, type_=REAL)
+        columns = (*columns, rank.label('rank'))
 
-    if filter.nome:
+    stmt = _filter_authors(select(*columns), filter)
+    stmt, size = paginate(stmt, Author.id, filter, rank=rank)
+
+    return page_results(
+        await session.execute(stmt),
+        size,
+        id_cursor if rank is None else rank_cursor,
+    )
+
+
+def _filter_authors(
+    stmt: Select, filter: FilterAuthor | ExportAuthor
+) -> Select:
+    if filter.nome and filter.fuzzy:
+        stmt = stmt.where(Author.name.op('%>')(filter.nome))
+    elif filter.nome:
         stmt = stmt.where(Author.name.ilike(f'%{filter.nome}%'))
 
-    authors = await session.scalars(stmt.offset(offset).limit(limit))
+    return stmt
+
 
-    return {'romancistas': authors}
+@router.get('/export', response_class=StreamingResponse)
+async def export_authors(
+    session: ReadSession, filter: Annotated[ExportAuthor, Query()]
+):
+    stmt = _filter_authors(
+        select(*project(Author, PublicAuthor, filter.fields)), filter
+    ).order_by(Author.id)
 
+    return export_response(session, stmt, filter.formato, 'romancistas')
 
-@router.get('/{id}', response_model=PublicAuthor)
-async def read_author(id: int, session: Session):
-    db_author = await session.scalar(select(Author).where(Author.id == id))
 
-    if not db_author:
+@router.get('/{id}/livros', response_model=AuthorBooks)
+async def read_author_books(
+    id: int,
+    session: ReadSession,
+    filter: Annotated[FilterAuthorBooks, Query()],
+):
+    size = page_size(filter.limit)
+    joined = Book.author_id == Author.id
+
+    if filter.cursor:
+        (last_id,) = decode_cursor(filter.cursor, 'id')
+        joined = and_(joined, Book.id > last_id)
+
+    total = (
+        select(func.count())
+        .where(Book.author_id == Author.id)
+        .correlate(Author)
+        .scalar_subquery()
+    )
+    # one statement: the outer join keeps the author row when the page is
+    # empty, so a missing author is told apart from one without books
+    rows = (
+        await session.execute(
+            select(
+                Author.name.label('author_name'),
+                total.label('total'),
+                *project(Book, PublicBook, None),
+            )
+            .outerjoin(Book, joined)
+            .where(Author.id == id)
+            .order_by(Book.id)
+            .limit(size + 1)
+        )
+    ).all()
+
+    if not rows:
         raise HTTPException(
             detail='Author not found', status_code=HTTPStatus.NOT_FOUND
         )
 
-    return db_author
+    books, next_cursor = page_results(
+        [row for row in rows if row.id is not None], size
+    )
 
+    return FastJSONResponse({
+        'romancista': {'id': id, 'name': rows[0].author_name},
+        'livros_count': rows[0].total,
+        'livros': rows_as(PublicBook, books),
+        'next_cursor': next_cursor,
+    })
 
-@router.post('/', status_code=HTTPStatus.CREATED, response_model=PublicAuthor)
-async def create_author(
-    author: AuthorSchema, session: Session, current_user: CurrentUser
+
+@router.get('/batch', response_model=AuthorBatch)
+async def batch_read_authors(
+    session: ReadSession, batch: Annotated[BatchIds, Query()]
 ):
-    db_author = await session.scalar(
-        select(Author).where(Author.name == author.nome)
+    items, missing = await read_by_ids(
+        session, Author, PublicAuthor, batch.ids
     )
 
-    if db_author:
+    return FastJSONResponse({'romancistas': items, 'missing': missing})
+
+
+@router.post('/bulk', response_model=BulkResult)
+async def bulk_create_authors(
+    request: Request, session: Session, current_user: CurrentUser
+):
+    result = await import_authors(session, request)
+    await response_cache.invalidate('authors')
+
+    return result
+
+
+@router.get('/{id}', response_model=PublicAuthor)
+async def read_author(
+    id: int, session: ReadSession, if_none_match: IfNoneMatch = None
+):
+    key = await response_cache.item_key('authors', id)
+    cached = await response_cache.get(key)
+
+    if cached:
+        return conditional(cached, if_none_match)
+
+    if if_none_match:
+        version = await session.scalar(
+            select(Author.version).where(Author.id == id)
+        )
+        etag = item_etag('authors', id, version)
+
+        if version and matches(if_none_match, etag):
+            return not_modified(etag)
+
+    db_author = (
+        await session.execute(
+            select(*project(Author, PublicAuthor, None, 'version')).where(
+                Author.id == id
+            )
+        )
+    ).first()
+
+    if not db_author:
         raise HTTPException(
-            detail=f'{author.nome} already exist',
-            status_code=HTTPStatus.CONFLICT,
+            detail='Author not found', status_code=HTTPStatus.NOT_FOUND
         )
 
-    new_author = Author(name=author.nome)
+    return await response_cache.store(
+        key,
+        row_as(PublicAuthor, db_author),
+        item_etag('authors', id, db_author.version),
+        replica=from_replica(session),
+    )
+
+
+@router.post('/', status_code=HTTPStatus.CREATED, response_model=PublicAuthor)
+async def create_author(
+    author: AuthorSchema, session: Session, current_user: CurrentUser
+):
+    new_author = await operations.create_author(session, author)
 
-    session.add(new_author)
     await session.commit()
-    await session.refresh(new_author)
+    await response_cache.invalidate('authors')
 
     return new_author
 
@@ -79,43 +353,20 @@ async def create_author(
 async def update_author(
     id: int, session: Session, author: AuthorSchema, current_user: CurrentUser
 ):
-    current_author = await session.scalar(
-        select(Author).where(Author.id == id)
-    )
-
-    if not current_author:
-        raise HTTPException(
-            detail='Author not exist', status_code=HTTPStatus.NOT_FOUND
-        )
+    current_author = await operations.update_author(session, id, author)
 
-    try:
-        current_author.name = author.nome
-
-        session.add(current_author)
-        await session.commit()
-        await session.refresh(current_author)
-
-        return current_author
+    await session.commit()
+    await response_cache.invalidate('authors', id)
 
-    except IntegrityError:
-        raise HTTPException(
-            detail=f'{author.nome} already exist',
-            status_code=HTTPStatus.CONFLICT,
-        )
+    return current_author
 
 
 @router.delete('/{id}', response_model=Message)
 async def delete_author(id: int, session: Session, current_user: CurrentUser):
-    current_author = await session.scalar(
-        select(Author).where(Author.id == id)
-    )
-
-    if not current_author:
-        raise HTTPException(
-            detail='Author not exist', status_code=HTTPStatus.NOT_FOUND
-        )
+    book_ids = await operations.delete_author(session, id)
 
-    await session.delete(current_author)
     await session.commit()
+    await response_cache.invalidate('authors', id)
+    await response_cache.invalidate('books', *book_ids)
 
     return {'message': 'Author successfully deleted'}
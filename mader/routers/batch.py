@@ -0,0 +1,132 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader import operations
+from mader.cache import response_cache
+from mader.database import get_session
+from mader.models import User
+from mader.responses import FastJSONResponse
+from mader.schemas import (
+    BatchOperation,
+    BatchRequest,
+    BatchResult,
+    CreateAuthor,
+    CreateBook,
+    DeleteAuthor,
+    DeleteBook,
+    PublicAuthor,
+    PublicBook,
+    UpdateAuthor,
+    UpdateBook,
+)
+from mader.security import get_current_user
+
+router = APIRouter(prefix='/batch', tags=['batch'])
+
+Session = Annotated[AsyncSession, Depends(get_session)]
+CurrentUser = Annotated[User, Depends(get_current_user)]
+
+
+# the user is authenticated once and every operation shares the session, so
+# the whole batch costs one request and one commit
+@router.post('/', response_model=BatchResult)
+async def run_batch(
+    batch: BatchRequest, session: Session, current_user: CurrentUser
+):
+    results = []
+    stale: dict[str, set[int]] = {}
+
+    for operation in batch.operations:
+        try:
+            if batch.atomic:
+                status, body, touched = await _apply(session, operation)
+            else:
+                async with session.begin_nested():
+                    status, body, touched = await _apply(session, operation)
+        except HTTPException as exc:
+            results.append({
+                'status': exc.status_code,
+                'body': {'message': exc.detail},
+            })
+
+            if batch.atomic:
+                await session.rollback()
+                return FastJSONResponse(
+                    {'committed': False, 'results': results},
+                    status_code=exc.status_code,
+                )
+
+            continue
+
+        results.append({'status': status, 'body': body})
+
+        for entity, ids in touched:
+            stale.setdefault(entity, set()).update(ids)
+
+    await session.commit()
+
+    for entity, ids in stale.items():
+        await response_cache.invalidate(entity, *ids)
+
+    return FastJSONResponse({'committed': True, 'results': results})
+
+
+# runs one operation, returning its status, its body and the cached
+# entities (with the ids) it made stale
+async def _apply(
+    session: AsyncSession, operation: BatchOperation
+) -> tuple[HTTPStatus, dict, list[tuple[str, list[int]]]]:
+    match operation:
+        case CreateBook(data=book):
+            new_book = await operations.create_book(session, book)
+            return (
+                HTTPStatus.CREATED,
+                _public(PublicBook, new_book),
+                [('books', [])],
+            )
+        case UpdateBook(id=id, data=book):
+            current_book, changed = await operations.update_book(
+                session, id, book
+            )
+            return (
+                HTTPStatus.OK,
+                _public(PublicBook, current_book),
+                [('books', [id])] if changed else [],
+            )
+        case DeleteBook(id=id):
+            await operations.delete_book(session, id)
+            return (
+                HTTPStatus.OK,
+                {'message': 'Book deleted'},
+                [('books', [id])],
+            )
+        case CreateAuthor(data=author):
+            new_author = await operations.create_author(session, author)
+            return (
+                HTTPStatus.CREATED,
+                _public(PublicAuthor, new_author),
+                [('authors', [])],
+            )
+        case UpdateAuthor(id=id, data=author):
+            current_author = await operations.update_author(
+                session, id, author
+            )
+            return (
+                HTTPStatus.OK,
+                _public(PublicAuthor, current_author),
+                [('authors', [id])],
+            )
+        case DeleteAuthor(id=id):
+            book_ids = await operations.delete_author(session, id)
+            return (
+                HTTPStatus.OK,
+                {'message': 'Author successfully deleted'},
+                [('authors', [id]), ('books', book_ids)],
+            )
+
+
+def _public(model, entity) -> dict:
+    return model.model_validate(entity, from_attributes=True).model_dump()
@@ -1,17 +1,46 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import (
+    REAL,
+    Select,
+    func,
+    select,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from mader.database import get_session
-from mader.models import Author, Book, User
+from mader import operations
+from mader.bulk import import_books
+from mader.cache import response_cache
+from mader.database import from_replica, get_read_session, get_session
+from mader.etag import (
+    IfNoneMatch,
+    conditional,
+    item_etag,
+    list_etag,
+    matches,
+    not_modified,
+)
+from mader.export import export_response
+from mader.models import Book, User
+from mader.pagination import id_cursor, page_results, paginate, rank_cursor
+from mader.responses import (
+    FastJSONResponse,
+    project,
+    read_by_ids,
+    row_as,
+    rows_as,
+)
 from mader.schemas import (
+    BatchIds,
+    BookBatch,
     Books,
     BookSchema,
     BookUpdate,
+    BulkResult,
+    ExportBook,
     FilterBook,
     Message,
     PublicBook,
@@ -21,44 +50,147 @@ from mader.security import get_current_user
 router = APIRouter(prefix='/livro', tags=['books'])
 
 Session = Annotated[AsyncSession, Depends(get_session)]
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
 @router.get('/', response_model=Books)
 async def filter_book(
-    session: Session, filter: Annotated[FilterBook, Query()]
+    session: ReadSession,
+    filter: Annotated[FilterBook, Query()],
+    if_none_match: IfNoneMatch = None,
 ):
-    offset = (filter.page - 1) * 20
-    limit = filter.page * 20
+    key = await response_cache.list_key('books', 'filter_book', filter)
+    cached = await response_cache.get(key)
 
-    stmt = select(Book)
+    if cached:
+        return conditional(cached, if_none_match)
 
-    if filter.ano:
-        stmt = stmt.where(Book.year == filter.ano).offset(offset).limit(limit)
-
-    if filter.titulo:
-        stmt = (
-            stmt
-            .where(Book.title.ilike(f'%{filter.titulo}%'))
-            .offset(offset)
-            .limit(limit)
+    if if_none_match:
+        versions, next_cursor = await _book_page(
+            session, filter, Book.id, Book.version
         )
+        etag = list_etag(versions, next_cursor, filter.fields)
+
+        if matches(if_none_match, etag):
+            return not_modified(etag)
+
+    books, next_cursor = await _book_page(
+        session,
+        filter,
+        *project(Book, PublicBook, filter.fields, 'id', 'version'),
+    )
+
+    return await response_cache.store(
+        key,
+        {
+            'livros': rows_as(PublicBook, books, filter.fields),
+            'next_cursor': next_cursor,
+        },
+        list_etag(books, next_cursor, filter.fields),
+        replica=from_replica(session),
+    )
+
+
+async def _book_page(session: AsyncSession, filter: FilterBook, *columns):
+    rank = None
+
+    if filter.fuzzy and filter.titulo:
+        rank = func.word_similarity(filter.titulo, Book.title, type_=REAL)
+        columns = (*columns, rank.label('rank'))
 
-    books = await session.scalars(stmt)
+    stmt = _filter_books(select(*columns), filter)
+    stmt, size = paginate(stmt, Book.id, filter, rank=rank)
 
-    return {'livros': books}
+    return page_results(
+        await session.execute(stmt),
+        size,
+        id_cursor if rank is None else rank_cursor,
+    )
+
+
+def _filter_books(stmt: Select, filter: FilterBook | ExportBook) -> Select:
+    if filter.ano:
+        stmt = stmt.where(Book.year == filter.ano)
+
+    if filter.titulo and filter.fuzzy:
+        stmt = stmt.where(Book.title.op('%>')(filter.titulo))
+    elif filter.titulo:
+        stmt = stmt.where(Book.title.ilike(f'%{filter.titulo}%'))
+
+    return stmt
+
+
+@router.get('/export', response_class=StreamingResponse)
+async def export_books(
+    session: ReadSession, filter: Annotated[ExportBook, Query()]
+):
+    stmt = _filter_books(
+        select(*project(Book, PublicBook, filter.fields)), filter
+    ).order_by(Book.id)
+
+    return export_response(session, stmt, filter.formato, 'livros')
+
+
+# declared before /{id} so 'batch' is not read as an id
+@router.get('/batch', response_model=BookBatch)
+async def batch_read_books(
+    session: ReadSession, batch: Annotated[BatchIds, Query()]
+):
+    items, missing = await read_by_ids(session, Book, PublicBook, batch.ids)
+
+    return FastJSONResponse({'livros': items, 'missing': missing})
+
+
+@router.post('/bulk', response_model=BulkResult)
+async def bulk_create_books(
+    request: Request, session: Session, current_user: CurrentUser
+):
+    result = await import_books(session, request)
+    await response_cache.invalidate('books')
+
+    return result
 
 
 @router.get('/{id}', response_model=PublicBook)
-async def read_book(id: int, session: Session):
-    db_book = await session.scalar(select(Book).where(Book.id == id))
+async def read_book(
+    id: int, session: ReadSession, if_none_match: IfNoneMatch = None
+):
+    key = await response_cache.item_key('books', id)
+    cached = await response_cache.get(key)
+
+    if cached:
+        return conditional(cached, if_none_match)
+
+    if if_none_match:
+        version = await session.scalar(
+            select(Book.version).where(Book.id == id)
+        )
+
+        etag = item_etag('books', id, version)
+
+        if version and matches(if_none_match, etag):
+            return not_modified(etag)
+
+    db_book = (
+        await session.execute(
+            select(*project(Book, PublicBook, None, 'version')).where(
+                Book.id == id
+            )
+        )
+    ).first()
 
     if not db_book:
         raise HTTPException(
             detail='Book not found', status_code=HTTPStatus.NOT_FOUND
         )
 
-    return db_book
+    return await response_cache.store(
+        key,
+        row_as(PublicBook, db_book),
+        item_etag('books', id, db_book.version),
+        replica=from_replica(session),
+    )
 
 
 @router.post('/', status_code=HTTPStatus.CREATED, response_model=PublicBook)
@@ -67,35 +199,10 @@ async def create_book(
     book: BookSchema,
     current_user: CurrentUser,
 ):
-    db_book = await session.scalar(
-        select(Book).where(Book.title == book.titulo)
-    )
-
-    if db_book:
-        raise HTTPException(
-            detail=f'{book.titulo} already exist',
-            status_code=HTTPStatus.CONFLICT,
-        )
-
-    db_author = await session.scalar(
-        select(Author).where(Author.id == book.romancista_id)
-    )
-
-    if not db_author:
-        raise HTTPException(
-            detail=f'Author {book.romancista_id} not found',
-            status_code=HTTPStatus.NOT_FOUND,
-        )
-
-    new_book = Book(
-        year=book.ano,
-        title=book.titulo,
-        author_id=book.romancista_id,
-    )
+    new_book = await operations.create_book(session, book)
 
-    session.add(new_book)
     await session.commit()
-    await session.refresh(new_book)
+    await response_cache.invalidate('books')
 
     return new_book
 
@@ -104,45 +211,21 @@ async def create_book(
 async def update_book(
     id: int, session: Session, book: BookUpdate, current_user: CurrentUser
 ):
-    current_book = await session.scalar(select(Book).where(Book.id == id))
-
-    if not current_book:
-        raise HTTPException(
-            detail='Book not exist',
-            status_code=HTTPStatus.NOT_FOUND,
-        )
-
-    try:
-        if book.ano:
-            current_book.year = book.ano
+    current_book, changed = await operations.update_book(session, id, book)
 
-        if book.titulo:
-            current_book.title = book.titulo
-
-        if book.romancista_id:
-            current_book.author_id = book.romancista_id
+    await session.commit()
 
-        await session.commit()
-        await session.refresh(current_book)
+    if changed:
+        await response_cache.invalidate('books', id)
 
-        return current_book
-    except IntegrityError:
-        raise HTTPException(
-            detail=f'{book.titulo} already exist',
-            status_code=HTTPStatus.CONFLICT,
-        )
+    return current_book
 
 
 @router.delete('/{id}', response_model=Message)
 async def delete_book(id: int, session: Session, current_user: CurrentUser):
-    current_book = await session.scalar(select(Book).where(Book.id == id))
-
-    if not current_book:
-        raise HTTPException(
-            detail='Book not exist', status_code=HTTPStatus.NOT_FOUND
-        )
+    await operations.delete_book(session, id)
 
-    await session.delete(current_book)
     await session.commit()
+    await response_cache.invalidate('books', id)
 
     return {'message': 'Book deleted'}
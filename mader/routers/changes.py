@@ -0,0 +1,45 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader.database import get_session
+from mader.events import stream_events
+from mader.feed import change_entry, change_position, read_changes
+from mader.pagination import page_size
+from mader.schemas import Changes, FilterChanges
+
+router = APIRouter(prefix='/changes', tags=['changes'])
+
+Session = Annotated[AsyncSession, Depends(get_session)]
+
+
+@router.get('/', response_model=Changes)
+async def list_changes(
+    session: Session, filter: Annotated[FilterChanges, Query()]
+):
+    rows, next_cursor, has_more = await read_changes(
+        session, filter.since, page_size(filter.limit)
+    )
+
+    return {
+        'mudancas': [change_entry(row) for row in rows],
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }
+
+
+@router.get('/stream', response_class=StreamingResponse)
+async def stream_changes(
+    session: Session,
+    last_event_id: Annotated[str | None, Header()] = None,
+):
+    if last_event_id:
+        change_position(last_event_id)
+
+    return StreamingResponse(
+        stream_events(session, last_event_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
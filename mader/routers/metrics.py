@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from mader.metrics import metrics
+from mader.schemas import MetricsSnapshot
+
+router = APIRouter(prefix='/metrics', tags=['metrics'])
+
+
+@router.get('/', response_model=MetricsSnapshot)
+def read_metrics():
+    return metrics.snapshot()
@@ -0,0 +1,49 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import REAL, func, literal, select
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mader.database import get_read_session
+from mader.models import Author, Book
+from mader.pagination import page_results, paginate, rank_cursor
+from mader.responses import FastJSONResponse, rows_as
+from mader.schemas import Search, SearchHit, SearchResults
+
+router = APIRouter(prefix='/busca', tags=['search'])
+
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
+
+
+@router.get('/', response_model=SearchResults)
+async def search(session: ReadSession, filter: Annotated[Search, Query()]):
+    query = func.websearch_to_tsquery(literal('simple', REGCONFIG), filter.q)
+    rank = func.ts_rank(Book.search_vector, query, type_=REAL)
+
+    columns = {
+        'id': Book.id,
+        'year': Book.year,
+        'title': Book.title,
+        'author_id': Book.author_id,
+        'author_name': Author.name.label('author_name'),
+        'rank': rank.label('rank'),
+    }
+    # the id and rank stay selected for the cursor
+    names = dict.fromkeys((*(filter.fields or columns), 'id', 'rank'))
+    stmt = select(*(columns[name] for name in names)).where(
+        Book.search_vector.bool_op('@@')(query)
+    )
+
+    if 'author_name' in names:
+        stmt = stmt.join(Author, Author.id == Book.author_id)
+
+    stmt, size = paginate(stmt, Book.id, filter, rank=rank)
+    hits, next_cursor = page_results(
+        await session.execute(stmt), size, rank_cursor
+    )
+
+    return FastJSONResponse({
+        'resultados': rows_as(SearchHit, hits, filter.fields),
+        'next_cursor': next_cursor,
+    })
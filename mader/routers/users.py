@@ -1,15 +1,21 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from mader.database import get_session
+from mader.database import get_session, violated_constraint
 from mader.models import User
+from mader.ratelimit import limit_attempts
 from mader.schemas import Message, PublicUser, UserSchema
-from mader.security import get_current_user, get_password_hash
+from mader.security import (
+    get_current_user,
+    get_password_hash_async,
+    user_cache,
+)
 
 router = APIRouter(prefix='/conta', tags=['users'])
 Session = Annotated[AsyncSession, Depends(get_session)]
@@ -17,34 +23,33 @@ CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
 @router.post('/', status_code=HTTPStatus.CREATED, response_model=PublicUser)
-async def create_user(user: UserSchema, session: Session):
-    db_user = await session.scalar(
-        select(User).where(
-            (User.username == user.username) | (User.email == user.email)
+async def create_user(request: Request, user: UserSchema, session: Session):
+    await limit_attempts(request, 'create_user', user.username)
+
+    try:
+        new_user = await session.scalar(
+            insert(User)
+            .values(
+                username=user.username,
+                email=user.email,
+                password=await get_password_hash_async(user.senha),
+            )
+            .returning(User)
         )
-    )
+    except IntegrityError as exc:
+        await session.rollback()
 
-    if db_user:
-        if db_user.username == user.username:
+        if violated_constraint(exc) == 'users_username_key':
             raise HTTPException(
                 detail='Username already exists',
                 status_code=HTTPStatus.CONFLICT,
             )
 
-        if db_user.email == user.email:
-            raise HTTPException(
-                detail='Email already exists', status_code=HTTPStatus.CONFLICT
-            )
-
-    new_user = User(
-        username=user.username,
-        email=user.email,
-        password=get_password_hash(user.senha),
-    )
+        raise HTTPException(
+            detail='Email already exists', status_code=HTTPStatus.CONFLICT
+        )
 
-    session.add(new_user)
     await session.commit()
-    await session.refresh(new_user)
     return new_user
 
 
@@ -59,22 +64,28 @@ async def update_user(
         )
 
     try:
-        current_user.username = user.username
-        current_user.email = user.email
-        current_user.password = get_password_hash(user.senha)
-
-        session.add(current_user)
-        await session.commit()
-        await session.refresh(current_user)
-
-        return current_user
-
+        updated_user = await session.scalar(
+            update(User)
+            .where(User.id == id)
+            .values(
+                username=user.username,
+                email=user.email,
+                password=await get_password_hash_async(user.senha),
+            )
+            .returning(User)
+        )
     except IntegrityError:
+        await session.rollback()
         raise HTTPException(
             detail='Username or Email already exists',
             status_code=HTTPStatus.CONFLICT,
         )
 
+    await session.commit()
+    user_cache.pop(id)
+
+    return updated_user
+
 
 @router.delete('/{id}', response_model=Message)
 async def delete_user(id: int, session: Session, current_user: CurrentUser):
@@ -84,7 +95,8 @@ async def delete_user(id: int, session: Session, current_user: CurrentUser):
             status_code=HTTPStatus.FORBIDDEN,
         )
 
-    await session.delete(current_user)
+    await session.execute(delete(User).where(User.id == id))
     await session.commit()
+    user_cache.pop(id)
 
     return {'message': 'User deleted'}
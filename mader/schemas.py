@@ -1,6 +1,17 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
-from pydantic import AfterValidator, BaseModel, ConfigDict, EmailStr, Field
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    BeforeValidator,
+    ConfigDict,
+    EmailStr,
+    Field,
+)
+
+from mader.settings import Settings
+
+settings = Settings()
 
 
 class _SerializationConfig(BaseModel):
@@ -11,6 +22,59 @@ def trim_whitespace(value: str) -> str:
     return ' '.join(value.split())
 
 
+# ?fields=id,title keeps only those keys in each returned item; the query
+# arrives as a list of values, ?fields=id&fields=title works as well
+def split_fields(
+    value: str | list[str] | None,
+) -> tuple[str, ...] | None:
+    if value is None:
+        return None
+
+    if isinstance(value, str):
+        value = [value]
+
+    return tuple(
+        dict.fromkeys(
+            field.strip() for item in value for field in item.split(',')
+        )
+    )
+
+
+def sparse_fields(model: type[BaseModel]) -> AfterValidator:
+    def validate(fields: tuple[str, ...] | None) -> tuple[str, ...] | None:
+        if fields is None:
+            return None
+
+        unknown = [
+            field for field in fields if field not in model.model_fields
+        ]
+
+        if unknown:
+            raise ValueError(
+                f'Unknown fields: {", ".join(unknown)}; '
+                f'expected any of {", ".join(model.model_fields)}'
+            )
+
+        return fields
+
+    return AfterValidator(validate)
+
+
+# ?ids=3,1,2 keeps the order given, without repeated ids
+def batch_ids(value: str) -> tuple[int, ...]:
+    try:
+        ids = tuple(dict.fromkeys(int(id) for id in value.split(',')))
+    except ValueError:
+        raise ValueError('ids must be comma separated integers')
+
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise ValueError(
+            f'At most {settings.BATCH_MAX_IDS} ids per request, got {len(ids)}'
+        )
+
+    return ids
+
+
 class UserSchema(BaseModel):
     username: Annotated[str, AfterValidator(trim_whitespace)]
     email: EmailStr
@@ -37,6 +101,42 @@ class Token(BaseModel):
     token_type: str
 
 
+class BulkError(BaseModel):
+    line: int
+    message: str
+
+
+class BulkResult(BaseModel):
+    created: int
+    errors: list[BulkError]
+
+
+class Timing(BaseModel):
+    count: int
+    sum: float
+    max: float
+
+
+class BatchIds(BaseModel):
+    ids: Annotated[str, AfterValidator(batch_ids)]
+
+
+class MetricsSnapshot(BaseModel):
+    counters: dict[str, int]
+    gauges: dict[str, float]
+    timings: dict[str, Timing]
+
+
+class _PaginationBase(BaseModel):
+    page: int = Field(ge=1, default=1)
+    cursor: str | None = None
+    limit: int | None = Field(ge=1, default=None)
+
+
+class _ExportBase(BaseModel):
+    formato: Literal['ndjson', 'csv'] = 'ndjson'
+
+
 class _BookOptionalBase(_SerializationConfig):
     ano: int | None = None
     titulo: Annotated[str, AfterValidator(trim_whitespace)] | None = None
@@ -59,12 +159,32 @@ class PublicBook(BaseModel):
     author_id: int
 
 
-class FilterBook(_BookOptionalBase):
-    page: int = Field(ge=1, default=1)
+class FilterBook(_BookOptionalBase, _PaginationBase):
+    fuzzy: bool = False
+    fields: Annotated[
+        tuple[str, ...] | None,
+        BeforeValidator(split_fields),
+        sparse_fields(PublicBook),
+    ] = None
+
+
+class ExportBook(_BookOptionalBase, _ExportBase):
+    fuzzy: bool = False
+    fields: Annotated[
+        tuple[str, ...] | None,
+        BeforeValidator(split_fields),
+        sparse_fields(PublicBook),
+    ] = None
 
 
 class Books(BaseModel):
     livros: list[PublicBook]
+    next_cursor: str | None = None
+
+
+class BookBatch(BaseModel):
+    livros: list[PublicBook]
+    missing: list[int]
 
 
 class _AuthorOptionalBase(_SerializationConfig):
@@ -84,9 +204,159 @@ class PublicAuthor(BaseModel):
     name: str
 
 
-class FilterAuthor(_AuthorOptionalBase):
-    page: int = Field(ge=1, default=1)
+class FilterAuthor(_AuthorOptionalBase, _PaginationBase):
+    fuzzy: bool = False
+    fields: Annotated[
+        tuple[str, ...] | None,
+        BeforeValidator(split_fields),
+        sparse_fields(PublicAuthor),
+    ] = None
+    include: Literal['livros'] | None = None
+
+
+class ExportAuthor(_AuthorOptionalBase, _ExportBase):
+    fuzzy: bool = False
+    fields: Annotated[
+        tuple[str, ...] | None,
+        BeforeValidator(split_fields),
+        sparse_fields(PublicAuthor),
+    ] = None
+
+
+class AuthorWithBooks(PublicAuthor):
+    livros: list[PublicBook]
+    livros_count: int
+    livros_next_cursor: str | None = None
 
 
 class Authors(BaseModel):
+    romancistas: list[AuthorWithBooks | PublicAuthor]
+    next_cursor: str | None = None
+
+
+class AuthorBatch(BaseModel):
     romancistas: list[PublicAuthor]
+    missing: list[int]
+
+
+class FilterAuthorBooks(BaseModel):
+    cursor: str | None = None
+    limit: int | None = Field(ge=1, default=None)
+
+
+class AuthorBooks(BaseModel):
+    romancista: PublicAuthor
+    livros_count: int
+    livros: list[PublicBook]
+    next_cursor: str | None = None
+
+
+class SearchHit(BaseModel):
+    id: int
+    year: int
+    title: str
+    author_id: int
+    author_name: str
+    rank: float
+
+
+class Search(_PaginationBase):
+    q: str = Field(min_length=1)
+    fields: Annotated[
+        tuple[str, ...] | None,
+        BeforeValidator(split_fields),
+        sparse_fields(SearchHit),
+    ] = None
+
+
+class SearchResults(BaseModel):
+    resultados: list[SearchHit]
+    next_cursor: str | None = None
+
+
+class _BookOperation(BaseModel):
+    entity: Literal['livro']
+
+
+class CreateBook(_BookOperation):
+    op: Literal['create']
+    data: BookSchema
+
+
+class UpdateBook(_BookOperation):
+    op: Literal['update']
+    id: int
+    data: BookUpdate
+
+
+class DeleteBook(_BookOperation):
+    op: Literal['delete']
+    id: int
+
+
+class _AuthorOperation(BaseModel):
+    entity: Literal['romancista']
+
+
+class CreateAuthor(_AuthorOperation):
+    op: Literal['create']
+    data: AuthorSchema
+
+
+class UpdateAuthor(_AuthorOperation):
+    op: Literal['update']
+    id: int
+    data: AuthorSchema
+
+
+class DeleteAuthor(_AuthorOperation):
+    op: Literal['delete']
+    id: int
+
+
+BatchOperation = Annotated[
+    Annotated[CreateBook | UpdateBook | DeleteBook, Field(discriminator='op')]
+    | Annotated[
+        CreateAuthor | UpdateAuthor | DeleteAuthor, Field(discriminator='op')
+    ],
+    Field(discriminator='entity'),
+]
+
+
+# atomic runs every operation in one transaction and stops at the first
+# failure; otherwise each runs in its own savepoint and the rest go on
+class BatchRequest(BaseModel):
+    atomic: bool = True
+    operations: list[BatchOperation] = Field(
+        min_length=1, max_length=settings.BATCH_MAX_OPERATIONS
+    )
+
+
+class OperationResult(BaseModel):
+    status: int
+    body: PublicBook | PublicAuthor | Message
+
+
+class BatchResult(BaseModel):
+    committed: bool
+    results: list[OperationResult]
+
+
+class FilterChanges(BaseModel):
+    since: str | None = None
+    limit: int | None = Field(ge=1, default=None)
+
+
+class ChangeEntry(BaseModel):
+    entity: Literal['books', 'authors']
+    id: int
+    operation: Literal['create', 'update', 'delete']
+    deleted: bool
+    livro: PublicBook | None = None
+    romancista: PublicAuthor | None = None
+
+
+class Changes(BaseModel):
+    mudancas: list[ChangeEntry]
+    next_cursor: str | None
+    has_more: bool
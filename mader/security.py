@@ -1,21 +1,29 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from http import HTTPStatus
+from time import perf_counter
 from zoneinfo import ZoneInfo
 
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jwt import DecodeError, ExpiredSignatureError, decode, encode
 from pwdlib import PasswordHash
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
+from mader.cache import TTLCache
 from mader.database import get_session
+from mader.metrics import metrics
 from mader.models import User
 from mader.settings import Settings
 
 pwd_context = PasswordHash.recommended()
 
 settings = Settings()
+user_cache = TTLCache(
+    'users', settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS
+)
 oauth2_schema = OAuth2PasswordBearer(tokenUrl='/auth/token')
 
 
@@ -27,6 +35,61 @@ def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+# Argon2 releases the GIL, so a few threads keep it off the event loop; jobs
+# beyond the workers wait in the executor queue until it is full and then
+# are shed
+class PasswordHashPool:
+    def __init__(self, workers: int, queue_size: int):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='password-hash'
+        )
+        self.workers = workers
+        self.queue_size = queue_size
+        self.backlog = 0
+
+    async def run(self, func, *args):
+        if self.backlog >= self.workers + self.queue_size:
+            metrics.inc('password_hash_shed_total')
+            raise HTTPException(
+                detail='Server busy, try again later',
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'},
+            )
+
+        self._track(1)
+        start = perf_counter()
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, func, *args
+            )
+        finally:
+            metrics.observe('password_hash_seconds', perf_counter() - start)
+            self._track(-1)
+
+    def _track(self, delta: int):
+        self.backlog += delta
+        metrics.set('password_hash_in_flight', min(self.backlog, self.workers))
+        metrics.set(
+            'password_hash_queue_depth', max(self.backlog - self.workers, 0)
+        )
+
+
+password_hash_pool = PasswordHashPool(
+    settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_SIZE
+)
+
+
+async def get_password_hash_async(password: str):
+    return await password_hash_pool.run(get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    return await password_hash_pool.run(
+        verify_password, plain_password, hashed_password
+    )
+
+
 def create_access_token(data: str):
     to_encode = data.copy()
 
@@ -58,15 +121,45 @@ async def get_current_user(
         if not subject:
             raise credentials_exception
 
+        user_id = int(subject)
+
     except DecodeError:
         raise credentials_exception
 
     except ExpiredSignatureError:
         raise credentials_exception
 
-    user = await session.scalar(select(User).where(User.email == subject))
+    except ValueError:
+        raise credentials_exception
+
+    user = await _resolve_user(session, user_id)
 
     if not user:
         raise credentials_exception
 
     return user
+
+
+async def _resolve_user(session: AsyncSession, id: int):
+    cached = user_cache.get(id)
+
+    if cached is not None:
+        return await session.merge(cached, load=False)
+
+    user = await session.get(User, id)
+
+    if user:
+        user_cache.set(id, _detached_copy(user))
+
+    return user
+
+
+def _detached_copy(user: User) -> User:
+    # a copy owned by no session, so concurrent requests each merge their own
+    copy = User(
+        email=user.email, username=user.username, password=user.password
+    )
+    copy.id = user.id
+    make_transient_to_detached(copy)
+
+    return copy
@@ -6,9 +6,95 @@ class Settings(BaseSettings):
         env_file='.env',
         env_file_encoding='utf-8',
         extra='ignore',
+        env_parse_none_str='None',
     )
 
     DATABASE_URL: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     SECRET_KEY: str
     ALGORITHM: str
+
+    # comma separated; reads fall back to DATABASE_URL when empty or when
+    # every replica is failing
+    DATABASE_REPLICA_URLS: str = ''
+    DATABASE_REPLICA_RETRY_SECONDS: float = 5.0
+    # the most a replica is expected to lag; for this long after a write,
+    # responses read from a replica are not cached
+    DATABASE_REPLICA_LAG_SECONDS: float = 5.0
+
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 5.0
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_PRE_PING: bool = True
+    # sent with the 503 answered when no connection frees up in time
+    DATABASE_POOL_RETRY_AFTER_SECONDS: int = 1
+    # psycopg prepares a statement after this many executions; None disables
+    # server-side prepared statements (needed behind pgbouncer in
+    # transaction mode)
+    DATABASE_PREPARE_THRESHOLD: int | None = 5
+
+    # milliseconds; the default is set on every connection, the entries below
+    # override it per route class (read, search, export, write) or per
+    # handler name (e.g. 'bulk_create_books') and 0 disables the timeout
+    STATEMENT_TIMEOUT_MS: int = 2000
+    STATEMENT_TIMEOUTS: dict[str, int] = {
+        'search': 1000,
+        'export': 60_000,
+        'write': 5000,
+        # one merge statement loads a whole import, maintaining the trigram
+        # and tsvector indexes row by row
+        'bulk_create_books': 600_000,
+        'bulk_create_authors': 600_000,
+    }
+
+    # concurrent requests per route class (read, search, export, write);
+    # a class left out is not limited
+    ADMISSION_LIMITS: dict[str, int] = {
+        'read': 32,
+        'search': 8,
+        'export': 2,
+        'write': 16,
+    }
+    ADMISSION_QUEUE_SIZE: int = 64
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+
+    PAGE_SIZE: int = 20
+    MAX_PAGE_SIZE: int = 100
+    # books embedded in each author by ?include=livros
+    EMBEDDED_BOOKS_LIMIT: int = 5
+    # ids resolved by one /livro/batch or /romancista/batch request
+    BATCH_MAX_IDS: int = 100
+    # sub-operations accepted by one POST /batch
+    BATCH_MAX_OPERATIONS: int = 100
+
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 10_000
+
+    RESPONSE_CACHE_URL: str = 'memory://'
+    RESPONSE_CACHE_TTL_SECONDS: int = 30
+    RESPONSE_CACHE_MAX_SIZE: int = 10_000
+
+    # token buckets for /auth/token and account creation, keyed by client IP
+    # and by the submitted account; memcached:// shares them across workers
+    RATE_LIMIT_URL: str = 'memory://'
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_IP_PER_MINUTE: float = 60
+    RATE_LIMIT_IP_BURST: int = 20
+    RATE_LIMIT_ACCOUNT_PER_MINUTE: float = 6
+    RATE_LIMIT_ACCOUNT_BURST: int = 5
+
+    CHANGE_LISTENER_RETRY_SECONDS: float = 1.0
+    # delay before a crashed background task (listener, broker) restarts
+    BACKGROUND_TASK_RETRY_SECONDS: float = 1.0
+
+    SSE_QUEUE_SIZE: int = 100
+    SSE_POLL_SECONDS: float = 1.0
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+
+    BULK_BATCH_SIZE: int = 1000
+    EXPORT_BATCH_SIZE: int = 1000
@@ -0,0 +1,20 @@
+import asyncio
+import logging
+
+from mader.metrics import metrics
+from mader.settings import Settings
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+
+
+# keeps a worker's background loop alive: an unexpected error is logged,
+# counted and the loop started again, instead of silently ending the task
+async def supervise(name: str, run):
+    while True:
+        try:
+            await run()
+        except Exception:
+            logger.exception('background task %s failed', name)
+            metrics.inc('background_task_failures_total', task=name)
+            await asyncio.sleep(settings.BACKGROUND_TASK_RETRY_SECONDS)
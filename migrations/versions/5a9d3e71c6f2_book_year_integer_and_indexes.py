@@ -0,0 +1,49 @@
+"""book year integer and indexes
+
+Revision ID: 5a9d3e71c6f2
+Revises: c41e7a9b2d08
+Create Date: 2026-10-18 13:27:51.630114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a9d3e71c6f2'
+down_revision: Union[str, Sequence[str], None] = 'c41e7a9b2d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column(
+        'books',
+        'year',
+        existing_type=sa.String(),
+        type_=sa.Integer(),
+        existing_nullable=False,
+        postgresql_using='year::integer',
+    )
+    op.create_index(
+        op.f('ix_books_author_id'), 'books', ['author_id'], unique=False
+    )
+    op.create_index(
+        'ix_books_year_title', 'books', ['year', 'title'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_year_title', table_name='books')
+    op.drop_index(op.f('ix_books_author_id'), table_name='books')
+    op.alter_column(
+        'books',
+        'year',
+        existing_type=sa.Integer(),
+        type_=sa.String(),
+        existing_nullable=False,
+    )
@@ -0,0 +1,62 @@
+"""author book version
+
+Revision ID: 71d0c8e3f5a2
+Revises: 9b4f1e6a0c35
+Create Date: 2026-10-18 17:20:48.104377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '71d0c8e3f5a2'
+down_revision: Union[str, Sequence[str], None] = '9b4f1e6a0c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'authors',
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+    )
+    op.add_column(
+        'books',
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+    )
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER authors_bump_version
+        BEFORE UPDATE OF name ON authors
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+        EXECUTE FUNCTION bump_version()
+    """)
+    op.execute("""
+        CREATE TRIGGER books_bump_version
+        BEFORE UPDATE OF year, title, author_id ON books
+        FOR EACH ROW WHEN (
+            (OLD.year, OLD.title, OLD.author_id)
+            IS DISTINCT FROM (NEW.year, NEW.title, NEW.author_id)
+        )
+        EXECUTE FUNCTION bump_version()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER books_bump_version ON books')
+    op.execute('DROP TRIGGER authors_bump_version ON authors')
+    op.execute('DROP FUNCTION bump_version()')
+    op.drop_column('books', 'version')
+    op.drop_column('authors', 'version')
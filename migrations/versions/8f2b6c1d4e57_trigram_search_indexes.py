@@ -0,0 +1,47 @@
+"""trigram search indexes
+
+Revision ID: 8f2b6c1d4e57
+Revises: 3cd485e0a277
+Create Date: 2026-10-18 09:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2b6c1d4e57'
+down_revision: Union[str, Sequence[str], None] = '3cd485e0a277'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_authors_name_trgm',
+        'authors',
+        ['name'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'},
+        postgresql_with={'fastupdate': 'off'},
+    )
+    op.create_index(
+        'ix_books_title_trgm',
+        'books',
+        ['title'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'title': 'gin_trgm_ops'},
+        postgresql_with={'fastupdate': 'off'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_title_trgm', table_name='books')
+    op.drop_index('ix_authors_name_trgm', table_name='authors')
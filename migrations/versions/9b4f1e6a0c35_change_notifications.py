@@ -0,0 +1,67 @@
+"""change notifications
+
+Revision ID: 9b4f1e6a0c35
+Revises: e2c7b5f80a13
+Create Date: 2026-10-18 16:42:10.513208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4f1e6a0c35'
+down_revision: Union[str, Sequence[str], None] = 'e2c7b5f80a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ['users', 'authors', 'books']
+TRIGGERS = [('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_changes() RETURNS trigger AS $$
+        DECLARE
+            ids integer[];
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP = 'INSERT' THEN
+                ids := '{}';
+            ELSE
+                SELECT array_agg(id) INTO ids
+                FROM (SELECT id FROM changed_rows LIMIT 101) AS changed;
+            END IF;
+
+            PERFORM pg_notify('mader_changes', json_build_object(
+                'entity', TG_TABLE_NAME,
+                'ids', CASE WHEN cardinality(ids) > 100 THEN NULL ELSE ids END
+            )::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        for operation, rows in TRIGGERS:
+            op.execute(f"""
+                CREATE TRIGGER {table}_notify_{operation.lower()}
+                AFTER {operation} ON {table}
+                REFERENCING {rows} TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_changes()
+            """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        for operation, _ in TRIGGERS:
+            op.execute(
+                f'DROP TRIGGER {table}_notify_{operation.lower()} ON {table}'
+            )
+    op.execute('DROP FUNCTION notify_changes()')
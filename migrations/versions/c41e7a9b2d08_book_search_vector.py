@@ -0,0 +1,90 @@
+"""book search vector
+
+Revision ID: c41e7a9b2d08
+Revises: 8f2b6c1d4e57
+Create Date: 2026-10-18 11:02:17.204381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7a9b2d08'
+down_revision: Union[str, Sequence[str], None] = '8f2b6c1d4e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'books',
+        sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True),
+    )
+    op.execute("""
+        CREATE OR REPLACE FUNCTION books_search_vector_update() RETURNS trigger
+        AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('simple', NEW.title), 'A')
+                || setweight(to_tsvector('simple', coalesce(
+                    (SELECT name FROM authors WHERE id = NEW.author_id), ''
+                )), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER books_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, author_id ON books
+        FOR EACH ROW EXECUTE FUNCTION books_search_vector_update()
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION authors_search_vector_update() RETURNS trigger
+        AS $$
+        BEGIN
+            UPDATE books
+            SET search_vector =
+                setweight(to_tsvector('simple', title), 'A')
+                || setweight(to_tsvector('simple', NEW.name), 'B')
+            WHERE author_id = NEW.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER authors_search_vector_update
+        AFTER UPDATE OF name ON authors
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+        EXECUTE FUNCTION authors_search_vector_update()
+    """)
+    op.execute("""
+        UPDATE books
+        SET search_vector =
+            setweight(to_tsvector('simple', books.title), 'A')
+            || setweight(to_tsvector('simple', authors.name), 'B')
+        FROM authors
+        WHERE authors.id = books.author_id
+    """)
+    op.create_index(
+        'ix_books_search_vector',
+        'books',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_with={'fastupdate': 'off'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_search_vector', table_name='books')
+    op.execute('DROP TRIGGER authors_search_vector_update ON authors')
+    op.execute('DROP FUNCTION authors_search_vector_update()')
+    op.execute('DROP TRIGGER books_search_vector_update ON books')
+    op.execute('DROP FUNCTION books_search_vector_update()')
+    op.drop_column('books', 'search_vector')
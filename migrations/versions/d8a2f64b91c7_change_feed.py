@@ -0,0 +1,105 @@
+"""change feed
+
+Revision ID: d8a2f64b91c7
+Revises: 71d0c8e3f5a2
+Create Date: 2026-10-18 18:03:27.640915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8a2f64b91c7'
+down_revision: Union[str, Sequence[str], None] = '71d0c8e3f5a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ['authors', 'books']
+TRIGGERS = [
+    ('INSERT', 'NEW TABLE AS changed_rows'),
+    ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS changed_rows'),
+    ('DELETE', 'OLD TABLE AS changed_rows'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.schema.CreateSequence(sa.Sequence('changes_seq')))
+    op.create_table(
+        'changes',
+        sa.Column('entity', sa.String(), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('deleted', sa.Boolean(), nullable=False),
+        sa.Column('xid', sa.BigInteger(), nullable=False),
+        sa.Column(
+            'seq',
+            sa.BigInteger(),
+            server_default=sa.text("nextval('changes_seq')"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint('entity', 'entity_id'),
+    )
+    op.create_index(
+        'ix_changes_xid_seq', 'changes', ['xid', 'seq'], unique=False
+    )
+    op.execute("""
+        CREATE OR REPLACE FUNCTION record_changes() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                INSERT INTO changes (entity, entity_id, deleted, xid, seq)
+                SELECT TG_TABLE_NAME, changed.id, false,
+                       pg_current_xact_id()::text::bigint,
+                       nextval('changes_seq')
+                FROM changed_rows AS changed
+                JOIN old_rows AS previous ON previous.id = changed.id
+                WHERE previous.version <> changed.version
+                ORDER BY changed.id
+                ON CONFLICT (entity, entity_id) DO UPDATE
+                SET deleted = false, xid = EXCLUDED.xid, seq = EXCLUDED.seq;
+            ELSE
+                INSERT INTO changes (entity, entity_id, deleted, xid, seq)
+                SELECT TG_TABLE_NAME, id, TG_OP = 'DELETE',
+                       pg_current_xact_id()::text::bigint,
+                       nextval('changes_seq')
+                FROM changed_rows
+                ORDER BY id
+                ON CONFLICT (entity, entity_id) DO UPDATE
+                SET deleted = EXCLUDED.deleted, xid = EXCLUDED.xid,
+                    seq = EXCLUDED.seq;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        for operation, rows in TRIGGERS:
+            op.execute(f"""
+                CREATE TRIGGER {table}_log_{operation.lower()}
+                AFTER {operation} ON {table}
+                REFERENCING {rows}
+                FOR EACH STATEMENT EXECUTE FUNCTION record_changes()
+            """)
+    # the rows already in the catalog are the first entries of the feed
+    for table in TABLES:
+        op.execute(f"""
+            INSERT INTO changes (entity, entity_id, deleted, xid)
+            SELECT '{table}', id, false, pg_current_xact_id()::text::bigint
+            FROM {table}
+            ORDER BY id
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        for operation, _ in TRIGGERS:
+            op.execute(
+                f'DROP TRIGGER {table}_log_{operation.lower()} ON {table}'
+            )
+    op.execute('DROP FUNCTION record_changes()')
+    op.drop_index('ix_changes_xid_seq', table_name='changes')
+    op.drop_table('changes')
+    op.execute(sa.schema.DropSequence(sa.Sequence('changes_seq')))
@@ -0,0 +1,39 @@
+"""cascade author books
+
+Revision ID: e2c7b5f80a13
+Revises: 5a9d3e71c6f2
+Create Date: 2026-10-18 14:05:36.881942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c7b5f80a13'
+down_revision: Union[str, Sequence[str], None] = '5a9d3e71c6f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint('books_author_id_fkey', 'books', type_='foreignkey')
+    op.create_foreign_key(
+        'books_author_id_fkey',
+        'books',
+        'authors',
+        ['author_id'],
+        ['id'],
+        ondelete='CASCADE',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('books_author_id_fkey', 'books', type_='foreignkey')
+    op.create_foreign_key(
+        'books_author_id_fkey', 'books', 'authors', ['author_id'], ['id']
+    )
@@ -1,33 +1,75 @@
+import socketserver
+import threading
+from contextlib import contextmanager
+
 import factory
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from testcontainers.postgres import PostgresContainer
 
+from mader import database
 from mader.app import app
-from mader.database import get_session
+from mader.cache import response_cache
+from mader.database import get_read_session, get_session
 from mader.models import Author, Book, User, table_registry
-from mader.security import get_password_hash
+from mader.ratelimit import account_limiter, ip_limiter
+from mader.security import get_password_hash, user_cache
 
 
 @pytest_asyncio.fixture
-async def client(session):
+async def client(session, engine, monkeypatch):
     def get_session_overrride():
         return session
 
+    # the change listener connects through the application engine
+    monkeypatch.setattr(database, 'engine', engine)
+
     with TestClient(app) as client:
         app.dependency_overrides[get_session] = get_session_overrride
+        app.dependency_overrides[get_read_session] = get_session_overrride
 
         yield client
 
     app.dependency_overrides.clear()
+    user_cache.clear()
+    await response_cache.clear()
+    await ip_limiter.clear()
+    await account_limiter.clear()
 
 
 @pytest_asyncio.fixture(scope='session')
 async def engine():
     with PostgresContainer('postgres:16', driver='psycopg') as postgres:
-        yield create_async_engine(postgres.get_connection_url())
+        yield database.create_engine(postgres.get_connection_url())
+
+
+# `with record_statements() as statements:` collects the SQL the app runs
+# inside the block
+@pytest.fixture
+def record_statements(engine):
+    @contextmanager
+    def record():
+        statements = []
+
+        def on_execute(conn, cursor, statement, *args):
+            # writes wake the change broker, which reads the feed on its own
+            # connection at any moment
+            if 'FROM changes' not in statement:
+                statements.append(statement)
+
+        event.listen(engine.sync_engine, 'before_cursor_execute', on_execute)
+
+        try:
+            yield statements
+        finally:
+            event.remove(
+                engine.sync_engine, 'before_cursor_execute', on_execute
+            )
+
+    return record
 
 
 @pytest_asyncio.fixture
@@ -110,6 +152,71 @@ async def other_book(session: AsyncSession):
     return new_book
 
 
+@pytest_asyncio.fixture
+async def books(session: AsyncSession, author):
+    new_books = BookFactory.create_batch(25, author_id=author.id)
+
+    session.add_all(new_books)
+    await session.commit()
+
+    return new_books
+
+
+@pytest_asyncio.fixture
+async def authors(session: AsyncSession):
+    new_authors = AuthorFactory.create_batch(25)
+
+    session.add_all(new_authors)
+    await session.commit()
+
+    return new_authors
+
+
+class _MemcachedHandler(socketserver.StreamRequestHandler):
+    # just enough of the memcached text protocol for MemcachedBackend
+    def handle(self):
+        self.server.connections += 1
+        entries = self.server.entries
+
+        for line in self.rfile:
+            command, *args = line.decode().split()
+
+            if command == 'get':
+                if args[0] in entries:
+                    value = entries[args[0]]
+                    self.wfile.write(
+                        f'VALUE {args[0]} 0 {len(value)}\r\n'.encode()
+                        + value
+                        + b'\r\n'
+                    )
+                self.wfile.write(b'END\r\n')
+            elif command == 'set':
+                entries[args[0]] = self.rfile.read(int(args[3]) + 2)[:-2]
+                self.wfile.write(b'STORED\r\n')
+            elif command == 'delete':
+                found = entries.pop(args[0], None) is not None
+                self.wfile.write(b'DELETED\r\n' if found else b'NOT_FOUND\r\n')
+            elif command == 'flush_all':
+                entries.clear()
+                self.wfile.write(b'OK\r\n')
+
+
+@pytest.fixture
+def memcached():
+    server = socketserver.ThreadingTCPServer(
+        ('127.0.0.1', 0), _MemcachedHandler
+    )
+    server.daemon_threads = True
+    server.entries = {}
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
 class UserFactory(factory.Factory):
     class Meta:
         model = User
@@ -131,5 +238,5 @@ class BookFactory(factory.Factory):
         model = Book
 
     year = factory.Sequence(lambda n: 2000 + n)
-    title = factory.LazyAttribute(lambda obj: f'Title{obj.year}')
+    title = factory.LazyAttribute(lambda obj: f'title{obj.year}')
     author_id = 1
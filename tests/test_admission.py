@@ -0,0 +1,93 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+from mader import admission
+from mader.admission import Gate, route_class
+from mader.metrics import metrics
+
+
+@pytest.mark.parametrize(
+    ('method', 'path', 'expected'),
+    [
+        ('GET', '/livro/', 'read'),
+        ('GET', '/livro/export', 'export'),
+        ('GET', '/busca/', 'search'),
+        ('POST', '/livro/', 'write'),
+        ('GET', '/metrics/', None),
+        ('GET', '/changes/stream', None),
+    ],
+)
+def test_route_class(method, path, expected):
+    assert route_class(method, path) == expected
+
+
+@pytest.mark.asyncio
+async def test_gate_queues_then_sheds():
+    gate = Gate('test-queue', limit=1, queue_size=1, timeout=5)
+    shed = metrics.count(
+        'admission_shed_total', route_class='test-queue', reason='queue_full'
+    )
+
+    assert await gate.acquire() is True
+
+    queued = asyncio.create_task(gate.acquire())
+    await asyncio.sleep(0)
+
+    assert len(gate.waiters) == 1
+    assert await gate.acquire() is False
+    assert metrics.count(
+        'admission_shed_total', route_class='test-queue', reason='queue_full'
+    ) == (shed + 1)
+
+    gate.release()
+
+    assert await queued is True
+    assert gate.in_flight == 1
+
+    gate.release()
+
+    assert gate.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_gate_frees_a_slot_handed_to_a_cancelled_waiter():
+    gate = Gate('test-cancel', limit=1, queue_size=1, timeout=5)
+    await gate.acquire()
+
+    queued = asyncio.create_task(gate.acquire())
+    await asyncio.sleep(0)
+    # the slot is handed over, then the waiter is cancelled before it runs
+    gate.release()
+    queued.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+
+    assert gate.in_flight == 0
+    assert not gate.waiters
+
+
+@pytest.mark.asyncio
+async def test_gate_sheds_after_waiting_too_long():
+    gate = Gate('test-timeout', limit=1, queue_size=1, timeout=0.01)
+    await gate.acquire()
+
+    assert await gate.acquire() is False
+    assert not gate.waiters
+    assert metrics.count(
+        'admission_shed_total', route_class='test-timeout', reason='timeout'
+    )
+
+
+def test_saturated_route_class_returns_503(client, monkeypatch, book):
+    monkeypatch.setitem(
+        admission.gates, 'read', Gate('read', limit=0, queue_size=0, timeout=1)
+    )
+
+    response = client.get(f'/livro/{book.id}')
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers['retry-after'] == '1'
+    assert client.get('/metrics').status_code == HTTPStatus.OK
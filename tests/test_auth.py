@@ -1,5 +1,12 @@
 from http import HTTPStatus
 
+import pytest
+
+from mader import ratelimit
+from mader.metrics import metrics
+from mader.ratelimit import TokenBucket, account_limiter, ip_limiter
+from mader.security import create_access_token, password_hash_pool
+
 
 def test_authentication(client, user):
     response = client.post(
@@ -46,3 +53,108 @@ def test_refresh_token(client, token):
     assert response.status_code == HTTPStatus.OK
     assert 'access_token' in token
     assert token['token_type'] == 'Bearer'
+
+
+def test_authentication_is_shed_when_hash_pool_is_full(
+    client, user, monkeypatch
+):
+    monkeypatch.setattr(password_hash_pool, 'backlog', 100)
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers['Retry-After'] == '1'
+    assert response.json() == {'message': 'Server busy, try again later'}
+
+
+def test_current_user_is_cached(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    hits = 'cache_hits_total{cache=users}'
+
+    client.post('/auth/refresh-token', headers=headers)
+    before = client.get('/metrics').json()['counters'].get(hits, 0)
+    client.post('/auth/refresh-token', headers=headers)
+    after = client.get('/metrics').json()['counters'][hits]
+
+    assert after == before + 1
+
+
+def test_token_with_invalid_subject(client):
+    token = create_access_token(data={'sub': 'alice@mader.com'})
+
+    response = client.post(
+        '/auth/refresh-token', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'message': 'Could not validate credentials'}
+
+
+def test_authentication_is_rate_limited_per_account(client, user, monkeypatch):
+    monkeypatch.setattr(account_limiter, 'burst', 2)
+    denied = metrics.count(
+        'rate_limit_decisions_total', limiter='account', decision='deny'
+    )
+
+    for _ in range(2):
+        response = client.post(
+            '/auth/token', data={'username': user.email, 'password': 'wrong'}
+        )
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.json() == {'message': 'Too many attempts, try again later'}
+    assert metrics.count(
+        'rate_limit_decisions_total', limiter='account', decision='deny'
+    ) == (denied + 1)
+
+    response = client.post(
+        '/auth/token', data={'username': 'other@mader.com', 'password': 'x'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_create_user_is_rate_limited_per_client(client, monkeypatch):
+    monkeypatch.setattr(ip_limiter, 'burst', 1)
+    statuses = [
+        client.post(
+            '/conta',
+            json={
+                'username': username,
+                'email': f'{username}@mader.com',
+                'senha': 'alice:mader',
+            },
+        ).status_code
+        for username in ('alice', 'bob')
+    ]
+
+    assert statuses == [HTTPStatus.CREATED, HTTPStatus.TOO_MANY_REQUESTS]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_refills(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(ratelimit, 'time', lambda: now)
+    bucket = TokenBucket('test', per_minute=60, burst=1)
+
+    assert await bucket.take('alice') == 0
+    assert await bucket.take('alice') == pytest.approx(1)
+    assert await bucket.take('bob') == 0
+
+    now += 0.5
+
+    assert await bucket.take('alice') == pytest.approx(0.5)
+
+    now += 0.5
+
+    assert await bucket.take('alice') == 0
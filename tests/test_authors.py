@@ -1,12 +1,16 @@
+import warnings
 from http import HTTPStatus
 
+from mader.routers.authors import settings
+
 
 def test_get_author_by_name(client, author):
     response = client.get(f'/romancista/?nome={author.name[0]}')
 
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {
-        'romancistas': [{'id': author.id, 'name': author.name}]
+        'romancistas': [{'id': author.id, 'name': author.name}],
+        'next_cursor': None,
     }
 
 
@@ -14,14 +18,73 @@ def test_get_author_by_name_without_user(client):
     response = client.get('/romancista/')
 
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'romancistas': []}
+    assert response.json() == {'romancistas': [], 'next_cursor': None}
 
 
 def test_get_non_existed_page(client):
     response = client.get('/romancista/?page=2')
 
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'romancistas': []}
+    assert response.json() == {'romancistas': [], 'next_cursor': None}
+
+
+def test_get_authors_with_cursor(client, authors):
+    response = client.get('/romancista/?limit=20')
+    first_page = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert [author['id'] for author in first_page['romancistas']] == [
+        author.id for author in authors[:20]
+    ]
+    assert first_page['next_cursor']
+
+    response = client.get(
+        f'/romancista/?limit=20&cursor={first_page["next_cursor"]}'
+    )
+    second_page = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert [author['id'] for author in second_page['romancistas']] == [
+        author.id for author in authors[20:]
+    ]
+    assert second_page['next_cursor'] is None
+
+
+def test_get_authors_with_sparse_fields(client, author):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        response = client.get('/romancista/?fields=name')
+
+    assert caught == []
+    assert response.json()['romancistas'] == [{'name': author.name}]
+
+
+def test_get_authors_with_invalid_cursor(client):
+    response = client.get('/romancista/?cursor=invalid')
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'message': 'Invalid cursor'}
+
+
+def test_batch_read_authors(client, author, other_author):
+    response = client.get(
+        f'/romancista/batch?ids={other_author.id},{author.id},0'
+    )
+
+    assert response.json() == {
+        'romancistas': [
+            {'id': other_author.id, 'name': other_author.name},
+            {'id': author.id, 'name': author.name},
+        ],
+        'missing': [0],
+    }
+
+
+def test_get_author_by_name_with_typo(client, author, other_author):
+    response = client.get('/romancista/?nome=other autor&fuzzy=true')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['romancistas'][0]['id'] == other_author.id
 
 
 def test_get_author_by_id(client, author):
@@ -104,6 +167,24 @@ def test_delete_author(client, token, author):
     assert response.json() == {'message': 'Author successfully deleted'}
 
 
+def test_delete_author_cascades_to_books_in_one_statement(
+    client, token, author, books, record_statements
+):
+    with record_statements() as statements:
+        response = client.delete(
+            f'/romancista/{author.id}',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    deletes = [s for s in statements if s.startswith('DELETE')]
+    assert len(deletes) == 1
+    assert deletes[0].startswith('DELETE FROM authors')
+    assert client.get(f'/livro/{books[0].id}').status_code == (
+        HTTPStatus.NOT_FOUND
+    )
+
+
 def test_delete_non_existed_author(client, token):
     response = client.delete(
         '/romancista/10',
@@ -112,3 +193,152 @@ def test_delete_non_existed_author(client, token):
 
     assert response.status_code == HTTPStatus.NOT_FOUND
     assert response.json() == {'message': 'Author not exist'}
+
+
+def test_bulk_create_authors(client, token, author):
+    response = client.post(
+        '/romancista/bulk',
+        content=(
+            'nome\n'
+            'Jorge Amado\n'
+            f'{author.name}\n'
+            'jorge amado\n'
+            '\n'
+            'Rachel de Queiroz\n'
+        ),
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'text/csv',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'created': 2,
+        'errors': [
+            {'line': 3, 'message': f'{author.name} already exist'},
+            {'line': 4, 'message': 'jorge amado already exist'},
+        ],
+    }
+
+
+def test_export_authors_as_csv(client, authors):
+    response = client.get(
+        f'/romancista/export?formato=csv&nome={authors[-1].name}'
+    )
+
+    assert response.text.splitlines() == [
+        'id,name',
+        f'{authors[-1].id},{authors[-1].name}',
+    ]
+
+
+def test_rename_author_keeps_book_versions(client, token, author, book):
+    response = client.patch(
+        f'/romancista/{author.id}',
+        json={'nome': 'Outro Nome'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert client.get(f'/romancista/{author.id}').headers['etag'] == (
+        f'"authors-{author.id}-2"'
+    )
+    assert client.get(f'/livro/{book.id}').headers['etag'] == (
+        f'"books-{book.id}-1"'
+    )
+
+
+def _selects(statements):
+    return [s for s in statements if s.startswith('SELECT')]
+
+
+def test_get_author_books_in_one_query(
+    client, author, books, record_statements
+):
+    limit = 20
+
+    with record_statements() as statements:
+        response = client.get(f'/romancista/{author.id}/livros?limit={limit}')
+    first_page = response.json()
+    second_page = client.get(
+        f'/romancista/{author.id}/livros?cursor={first_page["next_cursor"]}'
+    ).json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert len(_selects(statements)) == 1
+    assert first_page['romancista'] == {'id': author.id, 'name': author.name}
+    assert first_page['livros_count'] == len(books)
+    assert len(first_page['livros']) == limit
+    assert second_page['livros_count'] == len(books)
+    assert second_page['next_cursor'] is None
+    assert [book['id'] for book in first_page['livros']] + [
+        book['id'] for book in second_page['livros']
+    ] == sorted(book.id for book in books)
+
+
+def test_get_author_books_without_books(client, author):
+    response = client.get(f'/romancista/{author.id}/livros')
+
+    assert response.json() == {
+        'romancista': {'id': author.id, 'name': author.name},
+        'livros_count': 0,
+        'livros': [],
+        'next_cursor': None,
+    }
+
+
+def test_get_books_of_non_existed_author(client):
+    response = client.get('/romancista/1/livros')
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'message': 'Author not found'}
+
+
+def test_get_authors_including_books(
+    client, author, other_author, books, record_statements
+):
+    with record_statements() as statements:
+        response = client.get('/romancista/?include=livros')
+
+    first, second = response.json()['romancistas']
+    rest = client.get(
+        f'/romancista/{author.id}/livros'
+        f'?cursor={first["livros_next_cursor"]}&limit=100'
+    ).json()
+
+    # the page and the books of all its authors, with no load per author
+    assert [statement.split()[1] for statement in _selects(statements)] == [
+        'authors.id,',
+        'anon_1.id,',
+    ]
+    assert first['livros_count'] == len(books)
+    assert len(first['livros']) == settings.EMBEDDED_BOOKS_LIMIT
+    assert [book['id'] for book in first['livros'] + rest['livros']] == (
+        sorted(book.id for book in books)
+    )
+    assert second == {
+        'id': other_author.id,
+        'name': other_author.name,
+        'livros': [],
+        'livros_count': 0,
+        'livros_next_cursor': None,
+    }
+
+
+def test_authors_including_books_see_new_books(client, token, author):
+    before = client.get('/romancista/?include=livros')
+
+    client.post(
+        '/livro',
+        json={'ano': 1973, 'titulo': 'Cafe', 'romancista_id': author.id},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    after = client.get(
+        '/romancista/?include=livros',
+        headers={'If-None-Match': before.headers['etag']},
+    )
+
+    assert before.json()['romancistas'][0]['livros_count'] == 0
+    assert after.status_code == HTTPStatus.OK
+    assert after.json()['romancistas'][0]['livros'][0]['title'] == 'cafe'
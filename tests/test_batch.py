@@ -0,0 +1,121 @@
+from http import HTTPStatus
+
+
+def _batch(client, token, operations, atomic=True):
+    return client.post(
+        '/batch/',
+        json={'atomic': atomic, 'operations': operations},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+
+def test_batch_runs_operations_in_order(client, token, author, book):
+    cached = client.get('/livro/')
+
+    response = _batch(
+        client,
+        token,
+        [
+            {
+                'entity': 'livro',
+                'op': 'create',
+                'data': {
+                    'ano': 1973,
+                    'titulo': 'Cafe',
+                    'romancista_id': author.id,
+                },
+            },
+            {
+                'entity': 'livro',
+                'op': 'update',
+                'id': book.id,
+                'data': {'ano': 1899},
+            },
+            {'entity': 'romancista', 'op': 'create', 'data': {'nome': 'Ana'}},
+        ],
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['committed'] is True
+    assert [result['status'] for result in response.json()['results']] == [
+        HTTPStatus.CREATED,
+        HTTPStatus.OK,
+        HTTPStatus.CREATED,
+    ]
+    assert response.json()['results'][1]['body'] == {
+        'id': book.id,
+        'year': 1899,
+        'title': book.title,
+        'author_id': author.id,
+    }
+    assert client.get('/livro/').json() != cached.json()
+    assert client.get('/romancista/?nome=ana').json()['romancistas']
+
+
+def test_atomic_batch_rolls_back_on_failure(client, token, author):
+    # read before the rollback expires the fixture's attributes
+    author_id = author.id
+
+    response = _batch(
+        client,
+        token,
+        [
+            {'entity': 'romancista', 'op': 'create', 'data': {'nome': 'Ana'}},
+            {'entity': 'livro', 'op': 'delete', 'id': 0},
+            {'entity': 'romancista', 'op': 'delete', 'id': author_id},
+        ],
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json()['committed'] is False
+    # the failed operation is the last one run
+    assert response.json()['results'][-1] == {
+        'status': HTTPStatus.NOT_FOUND,
+        'body': {'message': 'Book not exist'},
+    }
+    assert client.get('/romancista/?nome=ana').json()['romancistas'] == []
+    assert client.get(f'/romancista/{author_id}').status_code == HTTPStatus.OK
+
+
+def test_batch_runs_each_operation_in_a_savepoint(client, token, author):
+    author_name = author.name
+
+    response = _batch(
+        client,
+        token,
+        [
+            {'entity': 'romancista', 'op': 'create', 'data': {'nome': 'Ana'}},
+            {
+                'entity': 'romancista',
+                'op': 'update',
+                'id': author.id,
+                'data': {'nome': 'Ana'},
+            },
+            {'entity': 'romancista', 'op': 'create', 'data': {'nome': 'Bia'}},
+        ],
+        atomic=False,
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['committed'] is True
+    assert [result['status'] for result in response.json()['results']] == [
+        HTTPStatus.CREATED,
+        HTTPStatus.CONFLICT,
+        HTTPStatus.CREATED,
+    ]
+    assert [
+        author['name']
+        for author in client.get('/romancista/').json()['romancistas']
+    ] == [author_name, 'ana', 'bia']
+
+
+def test_batch_with_unknown_operation(client, token):
+    response = _batch(client, token, [{'entity': 'livro', 'op': 'rename'}])
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_batch_without_token(client):
+    response = client.post('/batch/', json={'operations': []})
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
@@ -1,5 +1,16 @@
+import json
+import tracemalloc
+import warnings
 from http import HTTPStatus
 
+import pytest
+from sqlalchemy import select, text
+
+from mader import export, schemas
+from mader.cache import response_cache
+from mader.models import Book
+from mader.pagination import settings
+
 
 def test_get_book_by_title(client, book):
     response = client.get(f'/livro/?titulo={book.title[0]}')
@@ -13,7 +24,8 @@ def test_get_book_by_title(client, book):
                 'title': book.title,
                 'author_id': book.author_id,
             }
-        ]
+        ],
+        'next_cursor': None,
     }
 
 
@@ -21,14 +33,123 @@ def test_get_book_by_title_without_book(client):
     response = client.get('/livro/')
 
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'livros': []}
+    assert response.json() == {'livros': [], 'next_cursor': None}
 
 
 def test_get_non_existed_page(client):
     response = client.get('/livro/?page=2')
 
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'livros': []}
+    assert response.json() == {'livros': [], 'next_cursor': None}
+
+
+def test_get_books_with_cursor(client, books):
+    response = client.get('/livro/?limit=10')
+    first_page = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert [book['id'] for book in first_page['livros']] == [
+        book.id for book in books[:10]
+    ]
+
+    response = client.get(
+        f'/livro/?limit=10&cursor={first_page["next_cursor"]}'
+    )
+    second_page = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert [book['id'] for book in second_page['livros']] == [
+        book.id for book in books[10:20]
+    ]
+    assert second_page['next_cursor']
+
+
+def test_get_books_with_sparse_fields(client, books):
+    full = client.get('/livro/?limit=10')
+
+    # the cache key dumps the parsed fields, which must match their type
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        response = client.get('/livro/?limit=10&fields=title,id')
+
+    page = response.json()
+
+    assert caught == []
+    assert response.status_code == HTTPStatus.OK
+    assert page['livros'] == [
+        {'title': book.title, 'id': book.id} for book in books[:10]
+    ]
+    assert page['next_cursor'] == full.json()['next_cursor']
+    assert response.headers['etag'] != full.headers['etag']
+
+
+def test_get_books_with_repeated_fields(client, book):
+    response = client.get('/livro/?fields=title&fields=id')
+
+    assert response.json()['livros'] == [{'title': book.title, 'id': book.id}]
+
+
+def test_get_books_with_unknown_field(client):
+    response = client.get('/livro/?fields=title,isbn')
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_batch_read_books_keeps_order_and_reports_missing(
+    client, book, other_book, record_statements
+):
+    ids = [other_book.id, 0, book.id, other_book.id]
+
+    with record_statements() as statements:
+        response = client.get(f'/livro/batch?ids={",".join(map(str, ids))}')
+
+    assert response.status_code == HTTPStatus.OK
+    assert len(statements) == 1
+    assert [book['id'] for book in response.json()['livros']] == [
+        other_book.id,
+        book.id,
+    ]
+    assert response.json()['missing'] == [0]
+
+
+@pytest.mark.parametrize('ids', ['1,a', '1,2,3'])
+def test_batch_read_books_with_invalid_ids(client, monkeypatch, ids):
+    monkeypatch.setattr(schemas.settings, 'BATCH_MAX_IDS', 2)
+
+    response = client.get(f'/livro/batch?ids={ids}')
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_get_books_page_size_is_capped(client, books, monkeypatch):
+    max_page_size = 5
+    monkeypatch.setattr(settings, 'MAX_PAGE_SIZE', max_page_size)
+
+    response = client.get('/livro/?limit=50')
+
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.json()['livros']) == max_page_size
+
+
+def test_get_book_by_title_with_typo(client, book, other_book):
+    response = client.get('/livro/?titulo=other bok&fuzzy=true')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['livros'][0]['id'] == other_book.id
+
+
+def test_get_books_by_similarity_with_cursor(client, books):
+    ids = []
+    cursor = ''
+
+    while cursor is not None:
+        response = client.get(
+            f'/livro/?titulo=title20&fuzzy=true&limit=10&cursor={cursor}'
+        )
+        ids += [book['id'] for book in response.json()['livros']]
+        cursor = response.json()['next_cursor']
+
+    assert sorted(ids) == [book.id for book in books]
 
 
 def test_get_book_by_id(client, book):
@@ -61,15 +182,30 @@ def test_create_book(client, token, author):
         headers={'Authorization': f'Bearer {token}'},
     )
 
-    response.status_code = HTTPStatus.CREATED
-    response.json() == {
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json() == {
         'id': 1,
         'year': 1973,
-        'title': 'Cafe Da Manha dos Campeoes',
+        'title': 'cafe da manha dos campeoes',
         'author_id': author.id,
     }
 
 
+def test_create_book_in_one_statement(
+    client, token, author, record_statements
+):
+    with record_statements() as statements:
+        response = client.post(
+            '/livro',
+            json={'ano': 1973, 'titulo': 'Cafe', 'romancista_id': author.id},
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert len(statements) == 1
+    assert statements[0].startswith('INSERT INTO books')
+
+
 def test_create_book_with_existed_title(client, token, author, book):
     response = client.post(
         '/livro',
@@ -81,8 +217,19 @@ def test_create_book_with_existed_title(client, token, author, book):
         headers={'Authorization': f'Bearer {token}'},
     )
 
-    response.status_code = HTTPStatus.CONFLICT
-    response.json() == {'message': f'{book.title} already exist'}
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json() == {'message': f'{book.title} already exist'}
+
+
+def test_create_book_with_non_existed_author(client, token):
+    response = client.post(
+        '/livro',
+        json={'ano': 1973, 'titulo': 'Cafe', 'romancista_id': 10},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'message': 'Author 10 not found'}
 
 
 def test_update_book(client, book, token):
@@ -114,6 +261,17 @@ def test_update_non_existed_book(client, token, book):
     assert response.json() == {'message': 'Book not exist'}
 
 
+def test_update_book_with_non_existed_author(client, token, book):
+    response = client.patch(
+        f'/livro/{book.id}',
+        json={'romancista_id': 10},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'message': 'Author 10 not found'}
+
+
 def test_update_book_with_existed_title(client, token, book, other_book):
     other_title = other_book.title
     response = client.patch(
@@ -144,3 +302,293 @@ def test_delete_non_existed_book(client, token):
 
     assert response.status_code == HTTPStatus.NOT_FOUND
     assert response.json() == {'message': 'Book not exist'}
+
+
+def test_bulk_create_books_from_ndjson(client, token, author, book):
+    rows = [
+        {'ano': 1951, 'titulo': 'O Apanhador', 'romancista_id': author.id},
+        {'ano': 1952, 'titulo': book.title, 'romancista_id': author.id},
+        {'ano': 1953, 'titulo': 'Sem Autor', 'romancista_id': 999},
+        {'ano': 'antigo', 'titulo': 'Invalido', 'romancista_id': author.id},
+        {'ano': 1954, 'titulo': 'o apanhador', 'romancista_id': author.id},
+    ]
+
+    response = client.post(
+        '/livro/bulk',
+        content='\n'.join(json.dumps(row) for row in rows) + '\n{',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/x-ndjson',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['created'] == 1
+    assert [error['line'] for error in response.json()['errors']] == [
+        2,
+        3,
+        4,
+        5,
+        6,
+    ]
+    assert response.json()['errors'][1] == {
+        'line': 3,
+        'message': 'Author 999 not found',
+    }
+    assert response.json()['errors'][3] == {
+        'line': 5,
+        'message': 'o apanhador already exist',
+    }
+
+
+def test_bulk_create_books_from_csv(client, token, author):
+    response = client.post(
+        '/livro/bulk',
+        content=(
+            'ano,titulo,romancista_id\n'
+            f'1960,"Mar Morto",{author.id}\n'
+            f'1961,Capitaes da Areia,{author.id}\n'
+        ),
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'text/csv',
+        },
+    )
+
+    assert response.json() == {'created': 2, 'errors': []}
+
+    response = client.get('/livro/?titulo=areia')
+
+    assert [book['title'] for book in response.json()['livros']] == [
+        'capitaes da areia'
+    ]
+
+
+def test_bulk_create_books_from_csv_with_quoted_line_break(
+    client, token, author
+):
+    response = client.post(
+        '/livro/bulk',
+        content=(
+            'ano,titulo,romancista_id\n'
+            f'1960,"Mar\nMorto",{author.id}\n'
+            f'1961,Capitaes da Areia,{author.id}\n'
+            '1962,Tieta,999\n'
+        ),
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'text/csv',
+        },
+    )
+
+    # errors point at the record, the header being the first
+    assert response.json() == {
+        'created': 2,
+        'errors': [{'line': 4, 'message': 'Author 999 not found'}],
+    }
+    assert [
+        book['title']
+        for book in client.get('/livro/?titulo=morto').json()['livros']
+    ] == ['mar morto']
+
+
+def test_bulk_create_books_from_csv_with_bom(client, token, author):
+    response = client.post(
+        '/livro/bulk',
+        content=f'\ufeffano,titulo,romancista_id\n1960,Tieta,{author.id}\n',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'text/csv',
+        },
+    )
+
+    assert response.json() == {'created': 1, 'errors': []}
+
+
+@pytest.mark.parametrize(
+    ('content_type', 'content'),
+    [
+        (
+            'text/csv',
+            b'ano,titulo,romancista_id\n2004,\xff\xfe,%d\n2005,Tieta,%d\n',
+        ),
+        (
+            'application/x-ndjson',
+            b'{"ano": 2004, "titulo": "\xff\xfe", "romancista_id": %d}\n'
+            b'{"ano": 2005, "titulo": "Tieta", "romancista_id": %d}\n',
+        ),
+    ],
+)
+def test_bulk_create_books_with_invalid_utf8(
+    client, token, author, content_type, content
+):
+    response = client.post(
+        '/livro/bulk',
+        content=content % (author.id, author.id),
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': content_type,
+        },
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['created'] == 1
+    assert [error['message'] for error in response.json()['errors']] == [
+        'invalid UTF-8'
+    ]
+
+
+def test_bulk_create_books_unsupported_media_type(client, token):
+    response = client.post(
+        '/livro/bulk',
+        content='<livros/>',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/xml',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+    assert response.json() == {'message': 'Send the rows as NDJSON or CSV'}
+
+
+def test_export_books_as_ndjson(client, books):
+    response = client.get(f'/livro/export?ano={books[3].year}')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {
+            'id': books[3].id,
+            'year': books[3].year,
+            'title': books[3].title,
+            'author_id': books[3].author_id,
+        }
+    ]
+
+
+def test_export_books_as_csv(client, books):
+    response = client.get('/livro/export?formato=csv')
+
+    lines = response.text.splitlines()
+
+    assert response.headers['content-type'].startswith('text/csv')
+    assert lines[0] == 'id,year,title,author_id'
+    assert lines[1:] == [
+        f'{book.id},{book.year},{book.title},{book.author_id}'
+        for book in books
+    ]
+
+
+def test_export_books_with_sparse_fields(client, books):
+    response = client.get('/livro/export?formato=csv&fields=title')
+
+    assert response.text.splitlines() == [
+        'title',
+        *(book.title for book in books),
+    ]
+
+
+EXPORT_MEMORY_BUDGET = 512 * 1024
+
+
+@pytest.mark.asyncio
+async def test_export_memory_stays_flat(session, author, monkeypatch):
+    monkeypatch.setattr(export.settings, 'EXPORT_BATCH_SIZE', 100)
+    # seeding takes longer than the default statement timeout
+    await session.execute(text('SET LOCAL statement_timeout = 0'))
+    await session.execute(
+        text("""
+            INSERT INTO books (year, title, author_id)
+            SELECT 1900 + g % 120, 'title ' || g, :author_id
+            FROM generate_series(1, 30000) AS g
+        """),
+        {'author_id': author.id},
+    )
+    await session.commit()
+
+    stmt = select(Book.id, Book.year, Book.title, Book.author_id)
+    exported = 0
+
+    tracemalloc.start()
+    async for chunk in export.export_rows(session, stmt, 'ndjson'):
+        exported += len(chunk)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # buffering the export would hold every row and the whole body (~2MB)
+    assert exported > EXPORT_MEMORY_BUDGET * 3
+    assert peak < EXPORT_MEMORY_BUDGET
+
+
+def test_read_book_etag(client, token, book):
+    response = client.get(f'/livro/{book.id}')
+    etag = response.headers['etag']
+
+    assert etag == f'"books-{book.id}-1"'
+
+    response = client.get(f'/livro/{book.id}', headers={'If-None-Match': etag})
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b''
+
+    client.patch(
+        f'/livro/{book.id}',
+        json={'ano': book.year + 1},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    response = client.get(f'/livro/{book.id}', headers={'If-None-Match': etag})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['etag'] == f'"books-{book.id}-2"'
+
+
+@pytest.mark.asyncio
+async def test_read_book_not_modified_checks_only_the_version(
+    client, book, record_statements
+):
+    etag = client.get(f'/livro/{book.id}').headers['etag']
+    await response_cache.clear()
+
+    with record_statements() as statements:
+        response = client.get(
+            f'/livro/{book.id}', headers={'If-None-Match': f'W/{etag}'}
+        )
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert len(statements) == 1
+    assert statements[0].startswith('SELECT books.version')
+
+
+def test_update_book_without_changes_keeps_version(client, token, book):
+    response = client.patch(
+        f'/livro/{book.id}',
+        json={'ano': book.year},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert client.get(f'/livro/{book.id}').headers['etag'] == (
+        f'"books-{book.id}-1"'
+    )
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_filter_book_etag(client, token, books):
+    etag = client.get('/livro/?limit=5').headers['etag']
+    await response_cache.clear()
+
+    response = client.get('/livro/?limit=5', headers={'If-None-Match': etag})
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers['etag'] == etag
+
+    client.patch(
+        f'/livro/{books[2].id}',
+        json={'titulo': 'renamed'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    response = client.get('/livro/?limit=5', headers={'If-None-Match': etag})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['etag'] != etag
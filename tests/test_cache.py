@@ -0,0 +1,172 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+from mader import cache
+from mader.cache import (
+    MemcachedBackend,
+    MemoryBackend,
+    ResponseCache,
+    response_cache,
+)
+from mader.metrics import metrics
+
+
+def test_read_book_is_served_from_cache(client, book, record_statements):
+    client.get(f'/livro/{book.id}')
+
+    with record_statements() as statements:
+        response = client.get(f'/livro/{book.id}')
+
+    assert response.json()['title'] == book.title
+    assert statements == []
+
+
+def test_update_book_invalidates_cached_item(client, token, book):
+    client.get(f'/livro/{book.id}')
+    year = book.year + 1
+
+    client.patch(
+        f'/livro/{book.id}',
+        json={'ano': year},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert client.get(f'/livro/{book.id}').json()['year'] == year
+
+
+def test_create_book_invalidates_cached_lists(client, token, author):
+    assert client.get('/livro/?titulo=dom').json()['livros'] == []
+
+    client.post(
+        '/livro',
+        json={
+            'ano': 1899,
+            'titulo': 'Dom Casmurro',
+            'romancista_id': author.id,
+        },
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    response = client.get('/livro/?titulo=dom')
+
+    assert [book['title'] for book in response.json()['livros']] == [
+        'dom casmurro'
+    ]
+
+
+def test_create_author_keeps_cached_book_lists(
+    client, token, book, record_statements
+):
+    client.get('/livro/')
+
+    client.post(
+        '/romancista',
+        json={'nome': 'Machado de Assis'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    with record_statements() as statements:
+        response = client.get('/livro/')
+
+    assert response.json()['livros'][0]['id'] == book.id
+    assert statements == []
+
+
+def test_delete_author_invalidates_cached_books(client, token, author, book):
+    assert client.get(f'/livro/{book.id}').status_code == HTTPStatus.OK
+
+    client.delete(
+        f'/romancista/{author.id}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert client.get(f'/livro/{book.id}').status_code == HTTPStatus.NOT_FOUND
+    assert client.get(f'/romancista/{author.id}').status_code == (
+        HTTPStatus.NOT_FOUND
+    )
+
+
+def test_equivalent_filters_share_a_cache_entry(client, book):
+    client.get('/livro/?titulo=TITLE&page=1')
+    hits = metrics.count('cache_hits_total', cache='responses')
+
+    client.get('/livro/?titulo=title')
+
+    assert metrics.count('cache_hits_total', cache='responses') == hits + 1
+    assert metrics.snapshot()['gauges']['cache_hit_ratio{cache=responses}']
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_counts_evictions():
+    backend = MemoryBackend('eviction-test', max_size=2, ttl=60)
+
+    for key in ('a', 'b', 'c'):
+        await backend.set(key, key.encode())
+
+    assert await backend.get('a') is None
+    assert await backend.get('c') == b'c'
+    assert metrics.count('cache_evictions_total', cache='eviction-test') == 1
+
+
+@pytest.mark.asyncio
+async def test_memcached_backend(memcached):
+    backend = MemcachedBackend('memcached-test', *memcached.server_address, 60)
+
+    await backend.set('book:1', b'{"id": 1}')
+
+    assert await backend.get('book:1') == b'{"id": 1}'
+
+    await backend.delete('book:1')
+
+    assert await backend.get('book:1') is None
+    assert memcached.entries == {}
+
+
+@pytest.mark.asyncio
+async def test_memcached_backend_runs_calls_side_by_side(memcached):
+    backend = MemcachedBackend('memcached-pool', *memcached.server_address, 60)
+    backend.pool_size = 2
+
+    await asyncio.gather(*(backend.get(f'book:{id}') for id in range(4)))
+
+    # the waiting calls reuse the connections the first ones opened
+    assert memcached.connections == backend.pool_size
+
+
+@pytest.mark.asyncio
+async def test_memcached_backend_unreachable_is_a_miss(memcached):
+    host, port = memcached.server_address
+    memcached.shutdown()
+    memcached.server_close()
+    backend = MemcachedBackend('memcached-down', host, port, 60)
+
+    assert await backend.get('book:1') is None
+    assert metrics.count('cache_errors_total', cache='memcached-down') == 1
+
+
+def test_response_cache_over_memcached(client, book, memcached, monkeypatch):
+    backend = MemcachedBackend('responses', *memcached.server_address, 60)
+    monkeypatch.setattr(response_cache, 'backend', backend)
+
+    client.get(f'/livro/{book.id}')
+    epoch = memcached.entries['books:epoch'].decode()
+
+    assert memcached.entries[f'books:{epoch}:{book.id}'].startswith(b'"books-')
+
+
+@pytest.mark.asyncio
+async def test_replica_reads_right_after_a_write_are_not_stored(monkeypatch):
+    responses = ResponseCache('lag-test', MemoryBackend('lag-test', 10, 60))
+    await responses.invalidate('books', 1)
+
+    await responses.store('books:1', {'id': 1}, '"old"', replica=True)
+    await responses.store('books:2', {'id': 2}, '"new"')
+
+    assert await responses.get('books:1') is None
+    assert await responses.get('books:2') is not None
+
+    monkeypatch.setattr(cache.settings, 'DATABASE_REPLICA_LAG_SECONDS', 0)
+    await responses.store('books:1', {'id': 1}, '"new"', replica=True)
+
+    assert await responses.get('books:1') is not None
@@ -0,0 +1,225 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from mader import events, tasks
+from mader.feed import read_changes
+from mader.metrics import metrics
+from mader.models import Author
+from tests.conftest import BookFactory
+
+
+def _changes(client, since=None, **params):
+    if since:
+        params['since'] = since
+
+    return client.get('/changes', params=params).json()
+
+
+def _entries(feed):
+    return [
+        (change['entity'], change['id'], change['deleted'])
+        for change in feed['mudancas']
+    ]
+
+
+def test_changes_lists_latest_state_and_tombstones(client, token, book):
+    year = book.year + 1
+    client.patch(
+        f'/livro/{book.id}',
+        json={'ano': year},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    other = client.post(
+        '/livro',
+        json={'ano': 1900, 'titulo': 'Outro', 'romancista_id': book.author_id},
+        headers={'Authorization': f'Bearer {token}'},
+    ).json()
+    client.delete(
+        f'/livro/{other["id"]}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    feed = _changes(client)
+
+    assert _entries(feed) == [
+        ('authors', book.author_id, False),
+        ('books', book.id, False),
+        ('books', other['id'], True),
+    ]
+    assert feed['mudancas'][1]['livro']['year'] == year
+    assert feed['has_more'] is False
+
+
+def test_changes_since_cursor(client, token, author, books):
+    first = _changes(client, limit=20)
+
+    assert [change['id'] for change in first['mudancas'][1:]] == [
+        book.id for book in books[:19]
+    ]
+    assert first['has_more'] is True
+
+    rest = _changes(client, first['next_cursor'], limit=20)
+
+    assert [change['id'] for change in rest['mudancas']] == [
+        book.id for book in books[19:]
+    ]
+    assert rest['has_more'] is False
+
+    client.patch(
+        f'/romancista/{author.id}',
+        json={'nome': 'renomeado'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    delta = _changes(client, rest['next_cursor'])
+
+    # the rename refreshes every book's search_vector, yet only the author
+    # changed for the feed
+    assert _entries(delta) == [('authors', author.id, False)]
+    assert delta['mudancas'][0]['romancista']['name'] == 'renomeado'
+    assert _changes(client, delta['next_cursor']) == {
+        'mudancas': [],
+        'next_cursor': delta['next_cursor'],
+        'has_more': False,
+    }
+
+
+@pytest.mark.asyncio
+async def test_changes_wait_for_older_transactions(
+    client, token, engine, author
+):
+    cursor = _changes(client)['next_cursor']
+
+    async with engine.connect() as conn:
+        await conn.execute(insert(Author).values(name='em andamento'))
+
+        client.post(
+            '/livro',
+            json={'ano': 1900, 'titulo': 'Depois', 'romancista_id': author.id},
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+        assert _changes(client, cursor)['mudancas'] == []
+
+        await conn.commit()
+
+    assert [
+        change['entity'] for change in _changes(client, cursor)['mudancas']
+    ] == [
+        'authors',
+        'books',
+    ]
+
+
+def test_changes_invalid_cursor(client):
+    response = client.get('/changes?since=invalid')
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_stream_resumes_from_last_event_id(
+    session, monkeypatch, author, book
+):
+    broker = events.ChangeBroker(queue_size=10, poll_seconds=1)
+    monkeypatch.setattr(events, 'broker', broker)
+    _, after_author, _ = await read_changes(session, None, 1)
+
+    stream = events.stream_events(session, after_author)
+    replayed = await anext(stream)
+
+    assert replayed.startswith('id: ')
+    assert f'"id": {book.id}' in replayed
+
+    new_book = BookFactory(author_id=author.id)
+    session.add(new_book)
+    await session.commit()
+
+    # the broker publishes the replayed book again, the stream skips it
+    broker.cursor = after_author
+    await broker.fetch(session)
+    live = await anext(stream)
+
+    assert live.split('\n')[1] == 'event: create'
+    assert f'"id": {new_book.id}' in live
+
+    await stream.aclose()
+
+    assert broker.subscribers == set()
+
+
+def test_broker_drops_slow_consumer():
+    broker = events.ChangeBroker(queue_size=2, poll_seconds=1)
+    slow = broker.subscribe()
+    dropped = metrics.count('sse_dropped_total')
+
+    for seq in range(3):
+        broker.publish((1, seq), f'data: {seq}\n\n')
+
+    assert slow not in broker.subscribers
+    assert slow.get_nowait() is None
+    assert slow.empty()
+    assert metrics.count('sse_dropped_total') == dropped + 1
+
+
+@pytest.mark.asyncio
+async def test_broker_keeps_polling_after_pool_timeout(monkeypatch):
+    broker = events.ChangeBroker(queue_size=2, poll_seconds=0.01)
+    positioned = asyncio.Event()
+    errors = metrics.count('sse_fetch_errors_total')
+    attempts = []
+
+    async def latest_change(session):
+        attempts.append(session)
+
+        if len(attempts) == 1:
+            raise PoolTimeoutError('QueuePool limit reached')
+
+        positioned.set()
+
+    async def fetch(session):
+        pass
+
+    monkeypatch.setattr(events, 'latest_change', latest_change)
+    monkeypatch.setattr(broker, 'fetch', fetch)
+    task = asyncio.create_task(broker.run())
+
+    async with asyncio.timeout(5):
+        await positioned.wait()
+    task.cancel()
+
+    assert metrics.count('sse_fetch_errors_total') == errors + 1
+
+
+@pytest.mark.asyncio
+async def test_supervise_restarts_a_failed_task(monkeypatch):
+    monkeypatch.setattr(tasks.settings, 'BACKGROUND_TASK_RETRY_SECONDS', 0)
+    restarted = asyncio.Event()
+    runs = []
+
+    async def run():
+        runs.append(None)
+
+        if len(runs) == 1:
+            raise RuntimeError('boom')
+
+        restarted.set()
+        await asyncio.Event().wait()
+
+    task = asyncio.create_task(tasks.supervise('test-task', run))
+
+    async with asyncio.timeout(5):
+        await restarted.wait()
+    task.cancel()
+
+    assert metrics.count('background_task_failures_total', task='test-task')
+
+
+def test_stream_invalid_last_event_id(client):
+    response = client.get(
+        '/changes/stream', headers={'Last-Event-ID': 'invalid'}
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
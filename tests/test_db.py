@@ -1,10 +1,21 @@
 from dataclasses import asdict
+from http import HTTPStatus
 
 import pytest
-from sqlalchemy import select
+import pytest_asyncio
+from fastapi import Request
+from fastapi.routing import APIRoute
+from psycopg.errors import QueryCanceled
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from mader import database, handlers
+from mader.handlers import pool_timeout_handler, statement_timeout_handler
+from mader.metrics import metrics
 from mader.models import User
+from mader.routers import authors, books
 
 
 @pytest.mark.asyncio
@@ -22,3 +33,225 @@ async def test_create_user(session: AsyncSession):
         'email': 'test',
         'password': 'test',
     }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ('condition', 'index'),
+    [
+        ('author_id = 1', 'ix_books_author_id'),
+        ('year = 2000', 'ix_books_year_title'),
+        ("year = 2000 AND title ILIKE 'title%'", 'ix_books_year_title'),
+    ],
+)
+async def test_book_filters_use_indexes(
+    session: AsyncSession, books, condition, index
+):
+    await session.execute(text('ANALYZE books'))
+    await session.execute(text('SET LOCAL enable_seqscan = off'))
+
+    plan = await session.scalars(
+        text(f'EXPLAIN SELECT id FROM books WHERE {condition}')
+    )
+
+    assert index in '\n'.join(plan)
+
+
+@pytest_asyncio.fixture
+async def small_engine(engine, monkeypatch):
+    monkeypatch.setattr(database.settings, 'DATABASE_POOL_SIZE', 2)
+    monkeypatch.setattr(database.settings, 'DATABASE_MAX_OVERFLOW', 0)
+    monkeypatch.setattr(database.settings, 'DATABASE_POOL_TIMEOUT', 0.1)
+    small_engine = database.create_engine(
+        engine.url.render_as_string(hide_password=False), pool='small'
+    )
+
+    yield small_engine
+
+    await small_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_warm_pool_opens_base_connections(small_engine):
+    await database.warm_pool(small_engine)
+
+    assert small_engine.pool.checkedin() == small_engine.pool.size()
+
+
+def _pool_waits():
+    timings = metrics.snapshot()['timings']
+
+    return timings.get('db_pool_wait_seconds{pool=small}', {}).get('count', 0)
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics(small_engine):
+    waits = _pool_waits()
+    timeouts = metrics.count('db_pool_timeouts_total', pool='small')
+
+    async with small_engine.connect() as first, small_engine.connect():
+        await first.execute(text('SELECT 1'))
+
+        assert metrics.snapshot()['gauges'][
+            'db_pool_checked_out{pool=small}'
+        ] == (small_engine.pool.size())
+
+        with pytest.raises(PoolTimeoutError):
+            await small_engine.connect().start()
+
+    assert metrics.count('db_pool_timeouts_total', pool='small') == (
+        timeouts + 1
+    )
+    assert metrics.snapshot()['gauges']['db_pool_checked_out{pool=small}'] == 0
+    # two checkouts and the one that timed out
+    assert _pool_waits() == waits + 3
+
+
+def _request(method, path, endpoint=None):
+    return Request({
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'headers': [],
+        'endpoint': endpoint,
+    })
+
+
+@pytest.mark.asyncio
+async def test_read_session_takes_replicas_in_turn(engine, monkeypatch):
+    url = engine.url.render_as_string(hide_password=False)
+    replicas = database.Replicas([url, url], retry_seconds=5)
+    monkeypatch.setattr(database, 'replicas', replicas)
+    binds = []
+
+    for _ in range(4):
+        sessions = database.get_read_session(_request('GET', '/livro/'))
+        session = await anext(sessions)
+        await session.execute(text('SELECT 1'))
+        binds.append(session.bind.engine)
+        assert database.from_replica(session)
+        await sessions.aclose()
+
+    gauges = metrics.snapshot()['gauges']
+
+    assert binds == [replicas.engines[0], replicas.engines[1]] * 2
+    # each pool reports under its own label
+    assert [
+        gauges[f'db_pool_checked_out{{pool={pool}}}']
+        for pool in ('replica-0', 'replica-1')
+    ] == [0, 0]
+    await replicas.dispose()
+
+    assert replicas.engines[0].pool.label == 'replica-0'
+
+
+@pytest.mark.asyncio
+async def test_read_session_falls_back_to_primary(engine, monkeypatch):
+    replicas = database.Replicas(
+        ['postgresql+psycopg://mader@127.0.0.1:1/mader'], retry_seconds=5
+    )
+    monkeypatch.setattr(database, 'replicas', replicas)
+    monkeypatch.setattr(database, 'engine', engine)
+    errors = metrics.count('db_replica_errors_total', replica='0')
+
+    for _ in range(2):
+        sessions = database.get_read_session(_request('GET', '/livro/'))
+        session = await anext(sessions)
+
+        assert session.bind is engine
+        assert not database.from_replica(session)
+        assert await session.scalar(text('SELECT 1')) == 1
+        await sessions.aclose()
+
+    # the failing replica is skipped until retry_seconds pass
+    assert metrics.count('db_replica_errors_total', replica='0') == errors + 1
+    await replicas.dispose()
+
+
+def test_statement_timeout_per_route(monkeypatch):
+    timeouts = {'search': 100, 'write': 300, 'read_book': 50}
+    monkeypatch.setattr(database.settings, 'STATEMENT_TIMEOUTS', timeouts)
+
+    def read_book(): ...
+
+    requests = [
+        _request('GET', '/busca/'),
+        _request('PATCH', '/livro/1'),
+        _request('GET', '/livro/1', read_book),
+        _request('GET', '/livro/'),
+    ]
+
+    assert [database.statement_timeout(request) for request in requests] == [
+        timeouts['search'],
+        timeouts['write'],
+        timeouts['read_book'],
+        database.settings.STATEMENT_TIMEOUT_MS,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_session_applies_route_deadline(engine, monkeypatch):
+    monkeypatch.setattr(database, 'engine', engine)
+    monkeypatch.setattr(database.settings, 'STATEMENT_TIMEOUTS', {'read': 20})
+    sessions = database.get_session(_request('GET', '/livro/'))
+    session = await anext(sessions)
+
+    assert await session.scalar(text('SHOW statement_timeout')) == '20ms'
+
+    with pytest.raises(OperationalError) as error:
+        await session.execute(text('SELECT pg_sleep(1)'))
+
+    assert isinstance(error.value.orig, QueryCanceled)
+    await sessions.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'endpoint', [books.bulk_create_books, authors.bulk_create_authors]
+)
+async def test_bulk_import_runs_under_longer_deadline(
+    engine, monkeypatch, endpoint
+):
+    monkeypatch.setattr(database, 'engine', engine)
+    sessions = database.get_session(_request('POST', '/livro/bulk', endpoint))
+    session = await anext(sessions)
+
+    timeout = await session.scalar(
+        text('SELECT setting::int FROM pg_settings WHERE name = :name'),
+        {'name': 'statement_timeout'},
+    )
+
+    assert timeout == database.settings.STATEMENT_TIMEOUTS[endpoint.__name__]
+    assert timeout > database.settings.STATEMENT_TIMEOUTS['write']
+    await sessions.aclose()
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout_maps_to_504():
+    route = APIRoute('/busca/', endpoint=lambda: None)
+    request = _request('GET', '/busca/')
+    request.scope['route'] = route
+    timeouts = metrics.count('statement_timeouts_total', route='/busca/')
+
+    response = await statement_timeout_handler(
+        request, OperationalError('SELECT 1', {}, QueryCanceled())
+    )
+
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    assert metrics.count('statement_timeouts_total', route='/busca/') == (
+        timeouts + 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_pool_timeout_handler_sends_configured_retry(monkeypatch):
+    monkeypatch.setattr(
+        handlers.settings, 'DATABASE_POOL_RETRY_AFTER_SECONDS', 7
+    )
+
+    response = await pool_timeout_handler(
+        _request('GET', '/livro/'), PoolTimeoutError()
+    )
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers['Retry-After'] == '7'
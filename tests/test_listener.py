@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+
+import psycopg
+import pytest
+from sqlalchemy import insert, update
+
+from mader.cache import MemcachedBackend, response_cache
+from mader.listener import CHANNEL, apply_change, evict_all
+from mader.metrics import metrics
+from mader.models import Author, Book
+from mader.security import user_cache
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def _listener_connected():
+    return metrics.snapshot()['gauges'].get('change_listener_connected') == 1
+
+
+@pytest.mark.asyncio
+async def test_write_from_another_worker_evicts_cached_book(
+    client, session, book
+):
+    _wait_for(_listener_connected)
+    client.get(f'/livro/{book.id}')
+    year = book.year + 1
+
+    # a write that never went through this app's handlers
+    await session.execute(
+        update(Book).where(Book.id == book.id).values(year=year)
+    )
+    await session.commit()
+
+    _wait_for(lambda: client.get(f'/livro/{book.id}').json()['year'] == year)
+
+
+@pytest.mark.asyncio
+async def test_triggers_publish_changed_ids(session, engine, author):
+    url = engine.url.set(drivername='postgresql')
+    conn = await psycopg.AsyncConnection.connect(
+        url.render_as_string(hide_password=False), autocommit=True
+    )
+    await conn.execute(f'LISTEN {CHANNEL}')
+
+    await session.execute(
+        insert(Author), [{'name': f'author {n}'} for n in range(150)]
+    )
+    await session.execute(
+        update(Author).where(Author.id == author.id).values(name='renamed')
+    )
+    await session.execute(update(Author).values(name=Author.name + '!'))
+    await session.commit()
+
+    payloads = []
+    async with asyncio.timeout(5):
+        async for notify in conn.notifies(stop_after=3):
+            payloads.append(json.loads(notify.payload))
+    await conn.close()
+
+    assert payloads == [
+        {'entity': 'authors', 'ids': []},
+        {'entity': 'authors', 'ids': [author.id]},
+        {'entity': 'authors', 'ids': None},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_apply_change_evicts_users(user):
+    user_cache.set(user.id, user)
+    user_cache.set(user.id + 1, user)
+
+    await apply_change(json.dumps({'entity': 'users', 'ids': [user.id]}))
+
+    assert user_cache.lookup(user.id) is None
+    assert user_cache.lookup(user.id + 1) is user
+
+    await apply_change(json.dumps({'entity': 'users', 'ids': None}))
+
+    assert user_cache.lookup(user.id + 1) is None
+
+
+@pytest.mark.asyncio
+async def test_reconnect_keeps_shared_cache(memcached, monkeypatch):
+    backend = MemcachedBackend('responses', *memcached.server_address, 60)
+    monkeypatch.setattr(response_cache, 'backend', backend)
+    # stored by another worker, or by the rate limiter on the same server
+    memcached.entries['rate:ip:key'] = b'4 0'
+    item_key = await response_cache.item_key('books', 1)
+
+    await evict_all()
+    await apply_change(json.dumps({'entity': 'authors', 'ids': None}))
+
+    assert memcached.entries['rate:ip:key'] == b'4 0'
+    assert await response_cache.item_key('books', 1) != item_key
+    assert 'authors:epoch' in memcached.entries
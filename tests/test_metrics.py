@@ -0,0 +1,9 @@
+from http import HTTPStatus
+
+
+def test_read_metrics(client, token):
+    response = client.get('/metrics')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['gauges']['password_hash_queue_depth'] == 0
+    assert response.json()['timings']['password_hash_seconds']['count'] >= 1
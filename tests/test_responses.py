@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import text
+
+from mader.responses import FastJSONResponse, rows_as
+from mader.schemas import PublicBook
+
+
+@pytest.mark.asyncio
+async def test_rows_as_maps_columns_by_name(session):
+    rows = (
+        await session.execute(
+            text("""
+                SELECT 'Cafe' AS title, 2 AS version, 1 AS id,
+                       1973 AS year, 7 AS author_id
+            """)
+        )
+    ).all()
+
+    assert rows_as(PublicBook, rows) == [
+        {'id': 1, 'year': 1973, 'title': 'Cafe', 'author_id': 7}
+    ]
+    assert rows_as(PublicBook, []) == []
+
+
+def test_fast_json_response_renders_compact_json():
+    response = FastJSONResponse({'livros': [], 'next_cursor': None})
+
+    assert response.body == b'{"livros":[],"next_cursor":null}'
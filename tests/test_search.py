@@ -0,0 +1,71 @@
+from http import HTTPStatus
+
+
+def test_search_by_title(client, book, author):
+    response = client.get(f'/busca/?q={book.title}')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['resultados'] == [
+        {
+            'id': book.id,
+            'year': int(book.year),
+            'title': book.title,
+            'author_id': author.id,
+            'author_name': author.name,
+            'rank': response.json()['resultados'][0]['rank'],
+        }
+    ]
+    assert response.json()['next_cursor'] is None
+
+
+def test_search_with_sparse_fields(client, book, author):
+    response = client.get(f'/busca/?q={book.title}&fields=title,author_name')
+
+    assert response.json()['resultados'] == [
+        {'title': book.title, 'author_name': author.name}
+    ]
+
+
+def test_search_by_author_name(client, book, author):
+    response = client.get(f'/busca/?q={author.name}')
+
+    assert response.status_code == HTTPStatus.OK
+    assert [hit['id'] for hit in response.json()['resultados']] == [book.id]
+
+
+def test_search_follows_author_rename(client, token, book, author):
+    client.patch(
+        f'/romancista/{author.id}',
+        json={'nome': 'machado'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    response = client.get('/busca/?q=machado')
+
+    assert response.status_code == HTTPStatus.OK
+    assert [hit['author_name'] for hit in response.json()['resultados']] == [
+        'machado'
+    ]
+
+
+def test_search_ranks_title_matches_first(client, author, books):
+    ids = []
+    cursor = ''
+
+    while cursor is not None:
+        response = client.get(
+            f'/busca/?q={books[3].title} or {author.name}'
+            f'&limit=10&cursor={cursor}'
+        )
+        ids += [hit['id'] for hit in response.json()['resultados']]
+        cursor = response.json()['next_cursor']
+
+    assert ids[0] == books[3].id
+    assert sorted(ids) == [book.id for book in books]
+
+
+def test_search_without_results(client, book):
+    response = client.get('/busca/?q=inexistente')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'resultados': [], 'next_cursor': None}
@@ -33,6 +33,20 @@ def test_create_existed_user(client, user):
     assert response.json() == {'message': 'Username already exists'}
 
 
+def test_create_user_with_existed_email(client, user):
+    response = client.post(
+        '/conta',
+        json={
+            'username': 'alice',
+            'email': user.email,
+            'senha': 'alice:mader',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json() == {'message': 'Email already exists'}
+
+
 def test_update_user(client, user, token):
     response = client.put(
         f'/conta/{user.id}',
@@ -60,3 +74,16 @@ def test_delete_user(client, user, token):
 
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {'message': 'User deleted'}
+
+
+def test_deleted_user_token_is_rejected(client, user, token):
+    client.delete(
+        f'/conta/{user.id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    response = client.delete(
+        f'/conta/{user.id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'message': 'Could not validate credentials'}